@@ -0,0 +1,165 @@
+"""
+임베딩 처리량 벤치마크 (오프라인, 합성 다국어 코퍼스)
+
+    HF_HUB_OFFLINE=1 python -m benchmarks.embed_bench \
+        --batch-sizes 16,32,64,128 --truncations 0,256,1024 \
+        --backends torch,onnx --n 2000 --out bench.jsonl
+
+truncation은 토큰화 전 글자 수 자르기 (0 = 자르지 않고 토큰 한도만 적용).
+설정 조합마다 새 프로세스에서 실행해 peak RSS가 서로 섞이지 않게 함.
+결과는 한 줄에 하나씩 JSON으로 출력 (회귀 비교용).
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import get_context
+from typing import List, Tuple
+
+# 언어별 단어 풀 (뉴스레터/알림 메일 제목·본문 느낌)
+_WORDS = {
+    "ko": "이번 주 할인 소식 회원 님께 드리는 특별 혜택 주문 배송 완료 안내 결제 "
+    "확인 보안 알림 새로운 로그인 뉴스레터 구독 이벤트 당첨 쿠폰 발급 예약 "
+    "변경 일정 공지 업데이트 서비스 점검 감사합니다 오늘 마감 무료 배송".split(),
+    "en": "your order has shipped weekly digest new sign in detected exclusive "
+    "offer limited time only invoice payment received reminder meeting agenda "
+    "update account security newsletter unsubscribe free trial ends today".split(),
+    "ja": "ご注文 発送 完了 お知らせ 今週 セール 会員 限定 クーポン 新着 "
+    "ログイン 確認 ニュースレター 配信 停止 予約 変更 メンテナンス".split(),
+    "zh": "您的 订单 已 发货 本周 优惠 会员 专享 新 登录 提醒 账户 安全 "
+    "订阅 通讯 活动 中奖 优惠券 预约 变更 通知 更新".split(),
+    "es": "su pedido ha sido enviado oferta exclusiva boletín semanal nuevo "
+    "inicio de sesión recordatorio factura pago recibido cuenta".split(),
+    "de": "ihre bestellung wurde versandt wöchentlicher newsletter exklusives "
+    "angebot neue anmeldung erinnerung rechnung zahlung konto".split(),
+}
+
+
+def make_corpus(n: int, seed: int = 42) -> List[Tuple[str, str]]:
+    rnd = random.Random(seed)
+    langs = list(_WORDS)
+    corpus = []
+    for _ in range(n):
+        words = _WORDS[rnd.choice(langs)]
+        subject = " ".join(rnd.choices(words, k=rnd.randint(3, 12)))
+        snippet = " ".join(rnd.choices(words, k=rnd.randint(15, 80)))
+        corpus.append((subject, snippet))
+    return corpus
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def run_case(backend: str, batch_size: int, truncation: int, n: int, seed: int) -> dict:
+    # 새 프로세스 안에서 실행됨 → 설정을 바꾼 뒤에 모델을 로드
+    from mailgreen.app.config import Config
+
+    Config.EMBED_BACKEND = backend
+    Config.EMBED_POOL_SIZE = 0
+
+    from mailgreen.services.embed_service import (
+        _tokenize,
+        get_model,
+        iter_embeddings,
+        prepare_text,
+    )
+
+    corpus = make_corpus(n, seed)
+
+    t0 = time.perf_counter()
+    texts = [prepare_text(s, sn, truncation) for s, sn in corpus]
+    prep_sec = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    get_model()
+    load_sec = time.perf_counter() - t0
+
+    # 워밍업 (첫 배치 그래프 준비 비용 제외)
+    for _ in iter_embeddings(texts[:batch_size], batch_size):
+        pass
+
+    # iter_embeddings는 첫 배치 전에 코퍼스 전체를 토큰화 → 따로 측정
+    t0 = time.perf_counter()
+    _tokenize(texts)
+    tokenize_sec = time.perf_counter() - t0
+
+    latencies = []
+    t0 = last = time.perf_counter()
+    for _ in iter_embeddings(texts, batch_size):
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+    total = time.perf_counter() - t0
+    # 첫 간격은 토큰화 포함 → 배치 지연에서는 제외 (배치가 하나뿐이면 그대로)
+    batch_latencies = latencies[1:] or latencies
+
+    return {
+        "backend": backend,
+        "batch_size": batch_size,
+        "truncation": truncation,
+        "texts": n,
+        "texts_per_sec": round(n / total, 2),
+        "batch_p50_ms": round(_percentile(batch_latencies, 50) * 1000, 3),
+        "batch_p99_ms": round(_percentile(batch_latencies, 99) * 1000, 3),
+        "prep_texts_per_sec": round(n / prep_sec, 2) if prep_sec else None,
+        "tokenize_sec": round(tokenize_sec, 3),
+        "model_load_sec": round(load_sec, 3),
+        # Linux ru_maxrss는 KB 단위
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="embed_service throughput benchmark")
+    parser.add_argument("--batch-sizes", type=_ints, default=[16, 32, 64, 128])
+    parser.add_argument("--truncations", type=_ints, default=[0, 256, 1024])
+    parser.add_argument("--backends", default="torch")
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="-", help="JSON lines 출력 경로 (- = stdout)")
+    args = parser.parse_args(argv)
+
+    meta = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        cases = product(
+            args.backends.split(","), args.batch_sizes, args.truncations
+        )
+        for backend, batch_size, truncation in cases:
+            # 조합마다 새 프로세스 (spawn) → 모델/메모리 상태가 섞이지 않음
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(
+                    run_case, backend, batch_size, truncation, args.n, args.seed
+                ).result()
+            out.write(json.dumps({**meta, **result}, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""record which model produced each embedding
+
+Revision ID: 0b8ac098323c
+Revises: 0d3f15081cde
+Create Date: 2026-10-17 16:02:47.215903
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0b8ac098323c"
+down_revision: Union[str, None] = "0d3f15081cde"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 지금까지 저장된 벡터를 만든 모델
+LEGACY_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+def upgrade():
+    # 기본값을 주고 추가하면 테이블 재작성 없이 기존 행이 LEGACY_MODEL로 채워짐
+    # 이후 새 행은 애플리케이션이 직접 기록하므로 기본값은 제거
+    op.add_column(
+        "mail_embeddings",
+        sa.Column("embed_model", sa.Text(), server_default=LEGACY_MODEL),
+    )
+    op.alter_column("mail_embeddings", "embed_model", server_default=None)
+    op.add_column(
+        "major_topic_embedding",
+        sa.Column(
+            "embed_model", sa.Text(), nullable=False, server_default=LEGACY_MODEL
+        ),
+    )
+    op.alter_column("major_topic_embedding", "embed_model", server_default=None)
+
+    # 대주제 벡터는 모델마다 한 세트
+    op.drop_constraint(
+        "major_topic_embedding_pkey", "major_topic_embedding", type_="primary"
+    )
+    op.create_primary_key(
+        "major_topic_embedding_pkey",
+        "major_topic_embedding",
+        ["topic_id", "embed_model"],
+    )
+
+    # 차원 제한을 풀어 모델 교체 중 서로 다른 차원의 벡터가 함께 저장되도록 함
+    # HNSW 인덱스는 차원이 고정돼야 하므로 모델별 부분 인덱스로 생성
+    op.execute("DROP INDEX IF EXISTS hnsw_mail_vec_idx")
+    op.execute("ALTER TABLE mail_embeddings ALTER COLUMN vector TYPE halfvec")
+    op.execute("ALTER TABLE major_topic_embedding ALTER COLUMN vector TYPE halfvec")
+    op.execute(
+        f"""
+        CREATE INDEX hnsw_mail_vec_idx ON mail_embeddings
+          USING hnsw ((vector::halfvec(384)) halfvec_l2_ops)
+          WITH (m = 16, ef_construction = 200)
+          WHERE embed_model = '{LEGACY_MODEL}'
+        """
+    )
+
+
+def downgrade():
+    # 다른 모델로 만든 벡터는 되돌릴 수 없으므로 제거 후 다시 분석해야 함
+    op.execute("DROP INDEX IF EXISTS hnsw_mail_vec_idx")
+    op.execute(
+        f"""
+        UPDATE mail_embeddings SET vector = NULL
+        WHERE embed_model IS DISTINCT FROM '{LEGACY_MODEL}'
+        """
+    )
+    op.execute(
+        f"DELETE FROM major_topic_embedding WHERE embed_model <> '{LEGACY_MODEL}'"
+    )
+    op.execute(
+        "ALTER TABLE major_topic_embedding "
+        "ALTER COLUMN vector TYPE halfvec(384) USING vector::halfvec(384)"
+    )
+    op.execute(
+        "ALTER TABLE mail_embeddings "
+        "ALTER COLUMN vector TYPE halfvec(384) USING vector::halfvec(384)"
+    )
+    op.execute(
+        """
+        CREATE INDEX hnsw_mail_vec_idx ON mail_embeddings
+          USING hnsw (vector halfvec_l2_ops)
+          WITH (m = 16, ef_construction = 200)
+        """
+    )
+
+    op.drop_constraint(
+        "major_topic_embedding_pkey", "major_topic_embedding", type_="primary"
+    )
+    op.create_primary_key(
+        "major_topic_embedding_pkey", "major_topic_embedding", ["topic_id"]
+    )
+    op.drop_column("major_topic_embedding", "embed_model")
+    op.drop_column("mail_embeddings", "embed_model")
@@ -0,0 +1,61 @@
+"""store mail / topic embeddings as halfvec(384)
+
+Revision ID: 0d3f15081cde
+Revises: a4a916dd62dc
+Create Date: 2026-10-17 14:21:09.836412
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0d3f15081cde"
+down_revision: Union[str, None] = "a4a916dd62dc"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # halfvec은 pgvector 0.7.0 이상 필요
+    op.execute("ALTER EXTENSION vector UPDATE")
+
+    # 인덱스는 타입 변경 전에 지우고 halfvec 연산자로 다시 생성
+    op.execute("DROP INDEX IF EXISTS hnsw_mail_vec_idx")
+    op.execute(
+        "ALTER TABLE mail_embeddings "
+        "ALTER COLUMN vector TYPE halfvec(384) USING vector::halfvec(384)"
+    )
+    op.execute(
+        "ALTER TABLE major_topic_embedding "
+        "ALTER COLUMN vector TYPE halfvec(384) USING vector::halfvec(384)"
+    )
+    op.execute(
+        """
+        CREATE INDEX hnsw_mail_vec_idx ON mail_embeddings
+          USING hnsw (vector halfvec_l2_ops)
+          WITH (m = 16, ef_construction = 200)
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS hnsw_mail_vec_idx")
+    op.execute(
+        "ALTER TABLE major_topic_embedding "
+        "ALTER COLUMN vector TYPE vector(384) USING vector::vector(384)"
+    )
+    op.execute(
+        "ALTER TABLE mail_embeddings "
+        "ALTER COLUMN vector TYPE vector(384) USING vector::vector(384)"
+    )
+    op.execute(
+        """
+        CREATE INDEX hnsw_mail_vec_idx ON mail_embeddings
+          USING hnsw (vector vector_l2_ops)
+          WITH (m = 16, ef_construction = 200)
+        """
+    )
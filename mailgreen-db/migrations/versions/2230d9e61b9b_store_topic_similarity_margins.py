@@ -0,0 +1,81 @@
+"""store best / second topic similarity per mail
+
+Revision ID: 2230d9e61b9b
+Revises: 9cdbbb7c654a
+Create Date: 2026-10-17 19:11:26.470583
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "2230d9e61b9b"
+down_revision: Union[str, None] = "9cdbbb7c654a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column("mail_embeddings", sa.Column("best_sim", sa.Float(), nullable=True))
+    op.add_column(
+        "mail_embeddings", sa.Column("second_sim", sa.Float(), nullable=True)
+    )
+    op.execute("ALTER TABLE major_topic_embedding ADD COLUMN scored_vector halfvec")
+    # 지금 벡터를 기준으로 시작하고, 점수 없이 분류된 메일은 한 번 다시 분류
+    op.execute("UPDATE major_topic_embedding SET scored_vector = vector")
+    op.execute(
+        "UPDATE mail_embeddings SET classified_at = NULL "
+        "WHERE classified_at IS NOT NULL"
+    )
+
+    # ORM 밖(SQL/스크립트)에서 vector를 바꿔도 updated_at이 갱신되도록
+    # → 재분류 작업이 "이 시각 이전에 분류된 메일"을 빠짐없이 찾을 수 있음
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION major_topic_embedding_touch() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.vector IS DISTINCT FROM OLD.vector THEN
+                NEW.updated_at := NOW();
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER major_topic_embedding_touch
+          BEFORE UPDATE OF vector ON major_topic_embedding
+          FOR EACH ROW EXECUTE FUNCTION major_topic_embedding_touch()
+        """
+    )
+
+    # 분류 대기 = classified_at IS NULL (분류된 others 메일은 더 이상 대기 아님)
+    op.drop_index("ix_mail_embeddings_unclassified", table_name="mail_embeddings")
+    op.create_index(
+        "ix_mail_embeddings_unclassified",
+        "mail_embeddings",
+        ["user_id"],
+        postgresql_where=sa.text("classified_at IS NULL AND NOT is_deleted"),
+    )
+
+
+def downgrade():
+    op.execute(
+        "DROP TRIGGER IF EXISTS major_topic_embedding_touch ON major_topic_embedding"
+    )
+    op.execute("DROP FUNCTION IF EXISTS major_topic_embedding_touch()")
+    op.drop_index("ix_mail_embeddings_unclassified", table_name="mail_embeddings")
+    op.create_index(
+        "ix_mail_embeddings_unclassified",
+        "mail_embeddings",
+        ["user_id", "classified_at"],
+        postgresql_where=sa.text("category IS NULL AND NOT is_deleted"),
+    )
+    op.drop_column("major_topic_embedding", "scored_vector")
+    op.drop_column("mail_embeddings", "second_sim")
+    op.drop_column("mail_embeddings", "best_sim")
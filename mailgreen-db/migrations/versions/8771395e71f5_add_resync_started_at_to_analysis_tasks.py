@@ -0,0 +1,31 @@
+"""add resync_started_at to analysis_tasks
+
+Revision ID: 8771395e71f5
+Revises: fa037ed79d7a
+Create Date: 2026-10-17 21:32:08.904117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8771395e71f5"
+down_revision: Union[str, None] = "fa037ed79d7a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # historyId 만료로 전체 재적재를 시작한 시각 (NULL이면 일반 적재)
+    op.add_column(
+        "analysis_tasks",
+        sa.Column("resync_started_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("analysis_tasks", "resync_started_at")
@@ -0,0 +1,38 @@
+"""add classified_at to mail_embeddings
+
+Revision ID: 9cdbbb7c654a
+Revises: 0b8ac098323c
+Create Date: 2026-10-17 17:38:52.604117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9cdbbb7c654a"
+down_revision: Union[str, None] = "0b8ac098323c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # 기존 미분류 메일은 NULL → 첫 분류 작업에서 한 번만 다시 분류됨
+    op.add_column(
+        "mail_embeddings",
+        sa.Column("classified_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index(
+        "ix_mail_embeddings_unclassified",
+        "mail_embeddings",
+        ["user_id", "classified_at"],
+        postgresql_where=sa.text("category IS NULL AND NOT is_deleted"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_mail_embeddings_unclassified", table_name="mail_embeddings")
+    op.drop_column("mail_embeddings", "classified_at")
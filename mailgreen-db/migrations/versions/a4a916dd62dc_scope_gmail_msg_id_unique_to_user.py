@@ -0,0 +1,38 @@
+"""scope mail_embeddings.gmail_msg_id uniqueness to (user_id, gmail_msg_id)
+
+Revision ID: a4a916dd62dc
+Revises: e7c7c55375f0
+Create Date: 2026-10-17 11:03:27.540912
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a4a916dd62dc"
+down_revision: Union[str, None] = "e7c7c55375f0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # 전역 UNIQUE(gmail_msg_id) 제거 → 사용자 단위 UNIQUE(user_id, gmail_msg_id)
+    op.drop_constraint(
+        "mail_embeddings_gmail_msg_id_key", "mail_embeddings", type_="unique"
+    )
+    op.create_unique_constraint(
+        "uq_mail_embeddings_user_msg",
+        "mail_embeddings",
+        ["user_id", "gmail_msg_id"],
+    )
+
+
+def downgrade():
+    op.drop_constraint("uq_mail_embeddings_user_msg", "mail_embeddings", type_="unique")
+    op.create_unique_constraint(
+        "mail_embeddings_gmail_msg_id_key", "mail_embeddings", ["gmail_msg_id"]
+    )
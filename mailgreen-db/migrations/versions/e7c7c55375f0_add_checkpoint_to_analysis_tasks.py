@@ -0,0 +1,45 @@
+"""add checkpoint columns to analysis_tasks
+
+Revision ID: e7c7c55375f0
+Revises: 377fb1bec77a
+Create Date: 2026-10-17 10:12:41.118203
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7c7c55375f0"
+down_revision: Union[str, None] = "377fb1bec77a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # 마지막으로 커밋된 페이지 토큰 / 처리한 id 수 / 커밋된 청크 번호
+    op.add_column("analysis_tasks", sa.Column("page_token", sa.Text(), nullable=True))
+    op.add_column(
+        "analysis_tasks",
+        sa.Column(
+            "processed_count",
+            sa.Integer(),
+            nullable=False,
+            server_default=sa.text("0"),
+        ),
+    )
+    op.add_column(
+        "analysis_tasks",
+        sa.Column(
+            "last_chunk", sa.Integer(), nullable=False, server_default=sa.text("0")
+        ),
+    )
+
+
+def downgrade():
+    op.drop_column("analysis_tasks", "last_chunk")
+    op.drop_column("analysis_tasks", "processed_count")
+    op.drop_column("analysis_tasks", "page_token")
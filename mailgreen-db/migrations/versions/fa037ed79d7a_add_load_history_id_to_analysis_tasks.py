@@ -0,0 +1,30 @@
+"""add load_history_id to analysis_tasks
+
+Revision ID: fa037ed79d7a
+Revises: 2230d9e61b9b
+Create Date: 2026-10-17 21:04:37.512930
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "fa037ed79d7a"
+down_revision: Union[str, None] = "2230d9e61b9b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # 초기 적재를 시작할 때의 historyId (완료 후 증분 동기화 시작점)
+    op.add_column(
+        "analysis_tasks", sa.Column("load_history_id", sa.Text(), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column("analysis_tasks", "load_history_id")
@@ -11,3 +11,92 @@ class Config:
     GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
     GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
     CLIENT_REDIRECT_URI = os.getenv("CLIENT_REDIRECT_URI")
+
+    # run_analysis 파이프라인 단계 간 전달되는 청크 크기 (메모리 상한 = 청크 크기)
+    ANALYSIS_CHUNK_SIZE = int(os.getenv("ANALYSIS_CHUNK_SIZE", "500"))
+
+    # Gmail 메타데이터 동시 조회 (스레드 수 / 초당 요청 수 시작값·상한)
+    GMAIL_FETCH_WORKERS = int(os.getenv("GMAIL_FETCH_WORKERS", "4"))
+    GMAIL_RATE_INITIAL = float(os.getenv("GMAIL_RATE_INITIAL", "20"))
+    GMAIL_RATE_MAX = float(os.getenv("GMAIL_RATE_MAX", "50"))
+
+    # 분석 작업 스케줄러 (사용자별 동시 실행 수, 큐별 최대 실행 수, 초기 적재 분할 단위)
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/2")
+    SCHED_USER_CONCURRENCY = int(os.getenv("SCHED_USER_CONCURRENCY", "1"))
+    SCHED_MAX_INFLIGHT_INITIAL = int(os.getenv("SCHED_MAX_INFLIGHT_INITIAL", "4"))
+    SCHED_MAX_INFLIGHT_INCREMENTAL = int(
+        os.getenv("SCHED_MAX_INFLIGHT_INCREMENTAL", "16")
+    )
+    SCHED_INITIAL_SLICE_CHUNKS = int(os.getenv("SCHED_INITIAL_SLICE_CHUNKS", "20"))
+    SCHED_LEASE_SEC = int(os.getenv("SCHED_LEASE_SEC", "3600"))
+
+    # Gmail push 알림 (같은 사용자 알림을 묶는 시간, 웹훅 검증 토큰)
+    PUSH_DEBOUNCE_SEC = int(os.getenv("PUSH_DEBOUNCE_SEC", "10"))
+    PUSH_VERIFICATION_TOKEN = os.getenv("PUSH_VERIFICATION_TOKEN")
+    # 토큰 없이 알림을 받을지 (로컬 개발용, 운영에서는 토큰 필수)
+    PUSH_ALLOW_UNAUTHENTICATED = os.getenv(
+        "PUSH_ALLOW_UNAUTHENTICATED", "false"
+    ).lower() in ("1", "true", "yes")
+
+    # 사용자별 분석 단일 실행 lease (청크마다 연장)
+    ANALYSIS_LOCK_TTL_SEC = int(os.getenv("ANALYSIS_LOCK_TTL_SEC", "3600"))
+
+    # Celery 워커 부모 프로세스에서 임베딩 모델을 미리 로드 (fork된 자식과 공유)
+    EMBED_PRELOAD_IN_WORKER = os.getenv("EMBED_PRELOAD_IN_WORKER", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+    # 임베딩 마이크로배치 크기 (토큰 길이순으로 정렬 후 이 단위로 인코딩)
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+    # 임베딩 캐시 (프로세스 내 LRU 항목 수, Redis 계층 사용 여부·최대 항목 수)
+    EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    EMBED_CACHE_LOCAL_SIZE = int(os.getenv("EMBED_CACHE_LOCAL_SIZE", "20000"))
+    EMBED_CACHE_REDIS = os.getenv("EMBED_CACHE_REDIS", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    EMBED_CACHE_REDIS_SIZE = int(os.getenv("EMBED_CACHE_REDIS_SIZE", "500000"))
+    # 적중/미스 카운터를 Redis로 모아 보내는 주기 (초)
+    EMBED_CACHE_STATS_FLUSH_SEC = float(os.getenv("EMBED_CACHE_STATS_FLUSH_SEC", "30"))
+
+    # 임베딩 추론 백엔드: torch | onnx (동적 int8 양자화 ONNX 그래프)
+    EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+    # 양자화 모델 디렉터리 (절대 경로), 배포 단계에서 embed_backend export로 생성
+    EMBED_ONNX_DIR = os.getenv("EMBED_ONNX_DIR") or None
+    EMBED_ONNX_MIN_TOPIC_AGREEMENT = float(
+        os.getenv("EMBED_ONNX_MIN_TOPIC_AGREEMENT", "0.99")
+    )
+    EMBED_ONNX_QUANT = os.getenv("EMBED_ONNX_QUANT", "avx512_vnni")
+
+    # 멀티프로세스 임베딩 풀 (0이면 사용 안 함, 최소 텍스트 수 이상일 때만 사용)
+    EMBED_POOL_SIZE = int(os.getenv("EMBED_POOL_SIZE", "0"))
+    EMBED_POOL_MIN_TEXTS = int(os.getenv("EMBED_POOL_MIN_TEXTS", "1000"))
+    EMBED_POOL_CHUNK = int(os.getenv("EMBED_POOL_CHUNK", "256"))
+
+    # 노드 로컬 임베딩 서버 (unix:///경로 또는 http://host:port, 비우면 프로세스 안에서 인코딩)
+    EMBED_SERVER_URL = os.getenv("EMBED_SERVER_URL") or None
+    EMBED_SERVER_WINDOW_MS = float(os.getenv("EMBED_SERVER_WINDOW_MS", "10"))
+    EMBED_SERVER_MAX_BATCH = int(os.getenv("EMBED_SERVER_MAX_BATCH", "256"))
+    EMBED_SERVER_TIMEOUT_SEC = float(os.getenv("EMBED_SERVER_TIMEOUT_SEC", "120"))
+
+    # 대주제 분류 방식: python (벡터를 가져와 numpy로 계산) | db (pgvector로 DB 안에서 계산)
+    CLASSIFY_MODE = os.getenv("CLASSIFY_MODE", "python").lower()
+    # python 모드에서 한 청크가 쓰는 메모리 상한 (청크 행 수를 여기서 계산)
+    CLASSIFY_MEMORY_MB = int(os.getenv("CLASSIFY_MEMORY_MB", "64"))
+
+    # 임베딩 모델 (바꾸면 reembed_mails 작업으로 기존 벡터를 백필)
+    EMBED_MODEL_NAME = os.getenv(
+        "EMBED_MODEL_NAME",
+        "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+    )
+    REEMBED_CHUNK_SIZE = int(os.getenv("REEMBED_CHUNK_SIZE", "500"))
+    REEMBED_CHUNKS_PER_RUN = int(os.getenv("REEMBED_CHUNKS_PER_RUN", "20"))
+    REEMBED_THROTTLE_SEC = float(os.getenv("REEMBED_THROTTLE_SEC", "1.0"))
@@ -37,6 +37,7 @@ routers = [
     star_router,
     carbon_router,
     subscription_router,
+    push_router,
 ]
 
 for r in routers:
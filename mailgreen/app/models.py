@@ -10,10 +10,13 @@ from sqlalchemy import (
     Index,
     Float,
     ForeignKey,
+    UniqueConstraint,
+    func,
+    text,
 )
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.dialects.postgresql import UUID as PGUUID, ARRAY, TIMESTAMP, JSONB
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC
 from uuid import uuid4
 
 Base = declarative_base()
@@ -51,6 +54,15 @@ class AnalysisTask(Base):
     error_msg = Column(Text, nullable=True)
     history_id = Column(Text, nullable=True)
 
+    # 재시작 시 이어서 처리하기 위한 체크포인트
+    page_token = Column(Text, nullable=True)
+    processed_count = Column(Integer, nullable=False, server_default="0")
+    last_chunk = Column(Integer, nullable=False, server_default="0")
+    # 초기 적재 첫 페이지 조회 전의 historyId → 적재 중 도착한 메일은 증분 동기화로
+    load_history_id = Column(Text, nullable=True)
+    # historyId 만료로 전체 재적재 중이면 그 시작 시각 (기존 메일 상태도 다시 맞춤)
+    resync_started_at = Column(DateTime(timezone=True), nullable=True)
+
 
 class MajorTopic(Base):
     __tablename__ = "major_topic"
@@ -60,9 +72,7 @@ class MajorTopic(Base):
     description = Column(Text, nullable=True)
 
     mails = relationship("MailEmbedding", back_populates="topic")
-    embedding = relationship(
-        "MajorTopicEmbedding", back_populates="topic", uselist=False
-    )
+    embeddings = relationship("MajorTopicEmbedding", back_populates="topic")
 
 
 class MailEmbedding(Base):
@@ -70,7 +80,7 @@ class MailEmbedding(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
     user_id = Column(PGUUID(as_uuid=True), nullable=False)
-    gmail_msg_id = Column(String(32), unique=True, nullable=False)
+    gmail_msg_id = Column(String(32), nullable=False)
     thread_id = Column(String(32))
     sender = Column(String(320))
     subject = Column(Text)
@@ -80,7 +90,11 @@ class MailEmbedding(Base):
     is_read = Column(Boolean)
     is_starred = Column(Boolean)
     received_at = Column(DateTime(timezone=True))
-    vector = Column(Vector(384))
+    # halfvec(float16): 저장 공간과 스캔 I/O가 절반
+    # 차원을 고정하지 않아야 모델 교체 중 서로 다른 차원의 벡터가 함께 저장됨
+    vector = Column(HALFVEC())
+    # vector를 만든 모델 (embed_backend.model_id), 재임베딩 백필 기준
+    embed_model = Column(Text, nullable=True)
     keywords = Column(ARRAY(Text))
     processed_at = Column(DateTime(timezone=True), default=datetime.datetime.utcnow)
 
@@ -93,11 +107,26 @@ class MailEmbedding(Base):
         ForeignKey("major_topic.id", ondelete="SET NULL"),
         nullable=True,
     )
+    # 마지막으로 분류한 시각과 그때의 상위 2개 대주제 유사도
+    # (대주제 벡터가 바뀌면 결과가 뒤집힐 수 있는 메일만 다시 분류)
+    classified_at = Column(DateTime(timezone=True), nullable=True)
+    best_sim = Column(Float, nullable=True)
+    second_sim = Column(Float, nullable=True)
 
     topic = relationship("MajorTopic", back_populates="mails")
 
     # is_deleted 컬럼 인덱스 > 삭제되지 않은 레코드 빠르게 조회
-    __table_args__ = (Index("ix_mail_embeddings_is_deleted", "is_deleted"),)
+    # gmail 메시지 id는 사용자 단위로만 유일 (upsert 충돌 기준)
+    # 분류 대기 메일만 담는 부분 인덱스 > 사용자별 분류 작업이 전체를 훑지 않음
+    __table_args__ = (
+        Index("ix_mail_embeddings_is_deleted", "is_deleted"),
+        UniqueConstraint("user_id", "gmail_msg_id", name="uq_mail_embeddings_user_msg"),
+        Index(
+            "ix_mail_embeddings_unclassified",
+            "user_id",
+            postgresql_where=text("classified_at IS NULL AND NOT is_deleted"),
+        ),
+    )
 
 
 class MajorTopicEmbedding(Base):
@@ -108,17 +137,23 @@ class MajorTopicEmbedding(Base):
         ForeignKey("major_topic.id", ondelete="CASCADE"),
         primary_key=True,
     )
-    vector = Column(Vector(384), nullable=False)
+    # 모델별로 대주제 벡터를 따로 보관 → 메일은 같은 모델의 벡터와만 비교
+    embed_model = Column(Text, primary_key=True)
+    vector = Column(HALFVEC(), nullable=False)
+    # 현재 메일 분류 결과의 기준이 된 벡터 (재분류 작업이 vector와의 차이로 범위 계산)
+    scored_vector = Column(HALFVEC(), nullable=True)
+    # 벡터를 바꾸면 갱신 → 이 시각 이전에 분류된 메일만 재분류 후보
     updated_at = Column(
-        TIMESTAMP(timezone=True), nullable=False, server_default="NOW()"
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default="NOW()",
+        onupdate=func.now(),
     )
 
-    topic = relationship("MajorTopic", back_populates="embedding")
+    topic = relationship("MajorTopic", back_populates="embeddings")
 
 
-MajorTopic.embedding = relationship(
-    "MajorTopicEmbedding", back_populates="topic", uselist=False
-)
+MajorTopic.embeddings = relationship("MajorTopicEmbedding", back_populates="topic")
 
 
 class UserProtectedSender(Base):
@@ -0,0 +1,16 @@
+from typing import Dict
+
+import redis
+
+from mailgreen.app.config import Config
+
+_clients: Dict[bool, redis.Redis] = {}
+
+
+def get_redis(decode_responses: bool = True) -> redis.Redis:
+    # 프로세스당 하나의 커넥션 풀을 재사용 (바이너리 값을 다룰 때는 decode_responses=False)
+    if decode_responses not in _clients:
+        _clients[decode_responses] = redis.Redis.from_url(
+            Config.REDIS_URL, decode_responses=decode_responses
+        )
+    return _clients[decode_responses]
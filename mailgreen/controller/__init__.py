@@ -6,6 +6,7 @@ from .trash_controller import router as trash_router
 from .star_lable_controller import router as star_router
 from .carbon_controller import router as carbon_router
 from .subscription_controller import router as subscription_router
+from .push_controller import router as push_router
 
 __all__ = [
     "auth_router",
@@ -16,4 +17,5 @@ __all__ = [
     "star_router",
     "carbon_router",
     "subscription_router",
+    "push_router",
 ]
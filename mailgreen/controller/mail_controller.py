@@ -3,10 +3,13 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from celery.result import AsyncResult
-from mailgreen.tasks.mail_analysis import celery_app
 from mailgreen.app.database import get_db
-from mailgreen.services.mail_service import start_analysis_task, get_analysis_progress
+from mailgreen.services.mail_service import (
+    start_analysis_task,
+    get_analysis_progress,
+    get_task_progress,
+)
+from mailgreen.services.embed_cache import get_cache_stats
 
 router = APIRouter(prefix="/mail", tags=["mail"])
 
@@ -15,16 +18,19 @@ router = APIRouter(prefix="/mail", tags=["mail"])
 def analyze_mail(user_id: UUID, db: Session = Depends(get_db)) -> Dict[str, str]:
     info = start_analysis_task(db, str(user_id))
     return {
-        "message": "분석을 시작했습니다.",
+        "message": (
+            "이미 분석이 진행 중입니다."
+            if info["already_running"]
+            else "분석을 시작했습니다."
+        ),
         "task_id": info["task_id"],
         "start_history_id": info["start_history_id"],
     }
 
 
 @router.get("/progress/{task_id}")
-def progress(task_id: str):
-    result = AsyncResult(task_id, app=celery_app)
-    return {"state": result.state, "meta": result.info or {}}
+def progress(task_id: UUID, db: Session = Depends(get_db)):
+    return get_task_progress(db, str(task_id))
 
 
 @router.get("", summary="사용자별 분석 진행률")
@@ -33,3 +39,8 @@ def get_mail_progress(
     db: Session = Depends(get_db),
 ):
     return get_analysis_progress(db, str(user_id))
+
+
+@router.get("/embedding-cache", summary="임베딩 캐시 적중/미스 통계")
+def embedding_cache_stats():
+    return get_cache_stats()
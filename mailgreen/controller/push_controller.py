@@ -0,0 +1,38 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from mailgreen.app.config import Config
+from mailgreen.app.database import get_db
+from mailgreen.services.push_service import (
+    parse_notification,
+    handle_push_notification,
+)
+
+router = APIRouter(prefix="/push", tags=["push"])
+
+
+@router.post("/gmail", summary="Gmail watch 알림 수신")
+def gmail_push(
+    payload: dict = Body(...),
+    token: Optional[str] = Query(None, description="검증 토큰"),
+    db: Session = Depends(get_db),
+):
+    # 토큰이 설정되지 않았으면 개발용으로 명시적으로 허용한 경우에만 받음
+    expected = Config.PUSH_VERIFICATION_TOKEN
+    if expected:
+        if not token or not hmac.compare_digest(token, expected):
+            raise HTTPException(status_code=403, detail="invalid token")
+    elif not Config.PUSH_ALLOW_UNAUTHENTICATED:
+        raise HTTPException(status_code=403, detail="push verification not configured")
+    try:
+        email, history_id = parse_notification(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Pub/Sub은 2xx가 아니면 재전송하므로 모르는 사용자도 200으로 응답
+    # 가입 여부가 드러나지 않도록 응답 본문은 항상 같음
+    handle_push_notification(db, email, history_id)
+    return {"accepted": True}
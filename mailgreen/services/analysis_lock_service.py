@@ -0,0 +1,67 @@
+from typing import Optional
+
+from mailgreen.app.config import Config
+from mailgreen.app.redis_client import get_redis
+
+# 값이 내 task_id일 때만 삭제/연장 (다른 작업의 lease를 건드리지 않도록)
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_REFRESH_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _lock_key(user_id: str) -> str:
+    return f"analysis:active:{user_id}"
+
+
+def _rerun_key(user_id: str) -> str:
+    return f"analysis:rerun:{user_id}"
+
+
+def acquire_analysis_lock(user_id: str, task_id: str) -> Optional[str]:
+    """
+    사용자별 분석 lease 획득. 성공하면 None,
+    이미 실행 중이면 재실행 플래그를 세우고 실행 중인 task_id를 반환.
+    """
+    r = get_redis()
+    ttl = Config.ANALYSIS_LOCK_TTL_SEC
+    if r.set(_lock_key(user_id), task_id, nx=True, ex=ttl):
+        return None
+
+    active_id = r.get(_lock_key(user_id))
+    if active_id is None:
+        # 그 사이 lease가 풀린 경우 한 번 더 시도
+        if r.set(_lock_key(user_id), task_id, nx=True, ex=ttl):
+            return None
+        active_id = r.get(_lock_key(user_id))
+    r.set(_rerun_key(user_id), "1", ex=ttl)
+    return active_id
+
+
+def refresh_analysis_lock(user_id: str, task_id: str) -> bool:
+    r = get_redis()
+    return bool(
+        r.eval(
+            _REFRESH_LUA,
+            1,
+            _lock_key(user_id),
+            task_id,
+            Config.ANALYSIS_LOCK_TTL_SEC,
+        )
+    )
+
+
+def release_analysis_lock(user_id: str, task_id: str) -> bool:
+    """lease 반납. 실행 중 들어온 재실행 요청이 있었으면 True."""
+    r = get_redis()
+    r.eval(_RELEASE_LUA, 1, _lock_key(user_id), task_id)
+    return r.getdel(_rerun_key(user_id)) is not None
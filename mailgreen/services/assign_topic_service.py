@@ -1,77 +1,370 @@
+import logging
+import math
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
 import numpy as np
-from sqlalchemy import text
+from sqlalchemy import select, text
 from sqlalchemy.orm import Session
 
+from mailgreen.app.config import Config
 from mailgreen.app.database import SessionLocal
 from mailgreen.app.models import MailEmbedding, MajorTopicEmbedding
 
+logger = logging.getLogger(__name__)
+
+
+def vector_to_array(v) -> np.ndarray:
+    # vector 컬럼은 numpy 배열, halfvec 컬럼은 HalfVector 객체로 읽힘
+    if hasattr(v, "to_numpy"):
+        v = v.to_numpy()
+    return np.asarray(v, dtype=np.float32)
+
 
 # 코사인 유사도 계산 함수
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-10))
 
 
+def _normalize_rows(m: np.ndarray) -> np.ndarray:
+    # 행 단위 L2 정규화 → 내적이 곧 코사인 유사도
+    return m / (np.linalg.norm(m, axis=1, keepdims=True) + 1e-10)
+
+
 PROMOTION_ID = 5
 
 # 유사도 기준
 SIM_THRESHOLD = 0.4
 
 
-def batch_assign_category():
-    db: Session = SessionLocal()
+def load_topic_matrices(db: Session) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    embed_model → (topic_id 배열, 정규화된 (대주제 수, dim) 행렬).
+    재임베딩 백필 중에는 메일마다 벡터를 만든 모델이 다를 수 있어 모델별로 나눔.
+    """
+    rows = db.query(
+        MajorTopicEmbedding.embed_model,
+        MajorTopicEmbedding.topic_id,
+        MajorTopicEmbedding.vector,
+    ).all()
+
+    grouped: Dict[str, Tuple[List[int], List[np.ndarray]]] = {}
+    for r in rows:
+        ids, vecs = grouped.setdefault(r.embed_model, ([], []))
+        ids.append(r.topic_id)
+        vecs.append(vector_to_array(r.vector))
+    return {
+        model: (np.array(ids), _normalize_rows(np.stack(vecs)))
+        for model, (ids, vecs) in grouped.items()
+    }
+
+
+class TopicScore(NamedTuple):
+    category: Optional[int]
+    best_sim: Optional[float]  # 가장 가까운 대주제와의 코사인 유사도
+    second_sim: Optional[float]  # 두 번째로 가까운 대주제 (재분류 범위 계산용)
+
+
+def assign_categories(
+    rows: Sequence, topics: Dict[str, Tuple[np.ndarray, np.ndarray]]
+) -> List[TopicScore]:
+    """
+    (vector, labels, embed_model)를 가진 메일 행들의 category와 상위 2개 유사도를 계산.
+    모델별로 (메일 수, dim) @ (dim, 대주제 수) 행렬곱 한 번.
+    """
+    scores = [TopicScore(None, None, None)] * len(rows)
+    by_model: Dict[str, List[int]] = {}
+    for i, r in enumerate(rows):
+        # 같은 모델의 대주제 벡터가 아직 없으면 점수 없이 others
+        if r.vector is not None and r.embed_model in topics:
+            by_model.setdefault(r.embed_model, []).append(i)
+
+    for model, idx in by_model.items():
+        topic_ids, topic_mat = topics[model]
+        mail_mat = np.stack([vector_to_array(rows[i].vector) for i in idx])
+        mail_mat = _normalize_rows(mail_mat)
+        sims = mail_mat @ topic_mat.T
+        # 대주제는 몇 개뿐이라 전체 정렬로 충분
+        order = np.argsort(-sims, axis=1)[:, :2]
+        for j, i in enumerate(idx):
+            best = float(sims[j, order[j, 0]])
+            second = float(sims[j, order[j, 1]]) if order.shape[1] > 1 else None
+            # 기준 이상이면 해당 topic_id, 아니면 others(NULL)
+            cat = int(topic_ids[order[j, 0]]) if best >= SIM_THRESHOLD else None
+            scores[i] = TopicScore(cat, best, second)
+
+    for i, r in enumerate(rows):
+        if "CATEGORY_PROMOTIONS" in (r.labels or ()):
+            scores[i] = scores[i]._replace(category=PROMOTION_ID)
+    return scores
+
+
+def write_categories(
+    db: Session, mail_ids: List, scores: List[TopicScore], classified_at: datetime
+) -> int:
+    # 청크 전체를 UPDATE 한 번으로 반영, others(NULL)도 점수와 분류 시각은 기록
+    # classified_at은 대주제 벡터를 읽은 시각 (청크를 쓴 시각이 아님)
+    if not mail_ids:
+        return 0
+    result = db.execute(
+        text(
+            """
+            UPDATE mail_embeddings AS m
+            SET category = v.cat,
+                best_sim = v.best_sim,
+                second_sim = v.second_sim,
+                classified_at = :classified_at
+            FROM unnest(
+                CAST(:ids AS uuid[]),
+                CAST(:cats AS int[]),
+                CAST(:best AS real[]),
+                CAST(:second AS real[])
+            ) AS v(id, cat, best_sim, second_sim)
+            WHERE m.id = v.id
+            """
+        ),
+        {
+            "ids": [str(i) for i in mail_ids],
+            "cats": [sc.category for sc in scores],
+            "best": [sc.best_sim for sc in scores],
+            "second": [sc.second_sim for sc in scores],
+            "classified_at": classified_at,
+        },
+    )
+    return result.rowcount
+
+
+def _pending_query(user_id: Optional[str], gmail_msg_ids: Optional[List[str]]):
+    # 아직 분류되지 않은 메일 (대주제 벡터 변경 시에는 reclassify_changed_topics가
+    # 결과가 바뀔 수 있는 메일만 다시 이 상태로 되돌림)
+    stmt = select(
+        MailEmbedding.id,
+        MailEmbedding.vector,
+        MailEmbedding.labels,
+        MailEmbedding.embed_model,
+    ).where(
+        MailEmbedding.classified_at.is_(None),
+        MailEmbedding.is_deleted == False,
+    )
+    if user_id is not None:
+        stmt = stmt.where(MailEmbedding.user_id == user_id)
+    if gmail_msg_ids is not None:
+        stmt = stmt.where(MailEmbedding.gmail_msg_id.in_(gmail_msg_ids))
+    return stmt
+
+
+def _rows_for_budget(topics: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> int:
+    # 한 청크가 CLASSIFY_MEMORY_MB 안에 들어가도록 행 수 계산
+    # 행당: 읽어온 벡터 객체 + float32 변환 + 정규화 행렬 + 유사도, 라벨/id 등 여유 1KB
+    dim = max((mat.shape[1] for _, mat in topics.values()), default=384)
+    per_row = dim * 4 * 4 + 1024
+    return max(100, Config.CLASSIFY_MEMORY_MB * 1024 * 1024 // per_row)
+
+
+def classify_pending(
+    db: Session,
+    user_id: Optional[str] = None,
+    gmail_msg_ids: Optional[List[str]] = None,
+    chunk_size: Optional[int] = None,
+) -> int:
+    """
+    분류 대기 메일의 category를 계산해 청크마다 반영/커밋하고 분류한 메일 수를 반환.
+    user_id / gmail_msg_ids로 범위를 좁힘 (둘 다 None이면 전체).
+    대기 메일이 아무리 많아도 메모리에는 한 청크만 올라감.
+    """
+    # 대주제 벡터를 읽기 직전의 DB 시각 → 실행 도중 대주제가 바뀌어도
+    # 이 실행에서 분류한 메일은 모두 그 변경보다 먼저 분류된 것으로 남음
+    loaded_at = db.execute(text("SELECT statement_timestamp()")).scalar()
+    topics = load_topic_matrices(db)
+    chunk_size = chunk_size or _rows_for_budget(topics)
+
+    # 읽기는 별도 세션의 서버 측 커서로 청크씩 받고, 쓰기는 db에서 청크마다 커밋
+    # (같은 트랜잭션에서 커밋하면 서버 측 커서가 닫힘)
+    reader: Session = SessionLocal()
+    total = 0
     try:
-        # major_topic_embedding에서 topic_id(1~4)와 벡터를 모두 가져오기
-        mt_rows = db.query(
-            MajorTopicEmbedding.topic_id, MajorTopicEmbedding.vector
-        ).all()
-
-        topic_ids = [r.topic_id for r in mt_rows]  # [1,2,3,4]
-        topic_vecs = [
-            np.array(r.vector, dtype=float) for r in mt_rows
-        ]  # list of numpy arrays
-
-        # 아직 category=NULL이고 is_deleted=False인 메일만 조회
-        mail_rows = (
-            db.query(MailEmbedding.id, MailEmbedding.vector, MailEmbedding.labels)
-            .filter(MailEmbedding.category.is_(None), MailEmbedding.is_deleted == False)
-            .all()
+        result = reader.execute(
+            _pending_query(user_id, gmail_msg_ids).execution_options(
+                yield_per=chunk_size
+            )
         )
+        for chunk in result.partitions():
+            scores = assign_categories(chunk, topics)
+            write_categories(db, [r.id for r in chunk], scores, loaded_at)
+            db.commit()
+            total += len(chunk)
+    finally:
+        reader.close()
+    return total
+
+
+# 대기 메일을 id 순서로 한 청크씩 잠그고 (다른 분류 작업과 겹치지 않게 SKIP LOCKED)
+# 같은 모델의 가까운 대주제 2개를 pgvector 코사인 거리(<=>)로 구해서 바로 UPDATE
+# → 벡터가 DB 밖으로 나오지 않음, 분류 규칙은 assign_categories와 동일
+# 분류 시각은 대주제 벡터를 읽는 이 문장의 시작 시각 (트랜잭션 시작 시각인 NOW() 아님)
+_CLASSIFY_IN_DB_SQL = """
+WITH batch AS (
+    SELECT m.id
+    FROM mail_embeddings AS m
+    WHERE m.classified_at IS NULL
+      AND NOT m.is_deleted
+      AND (CAST(:uid AS uuid) IS NULL OR m.user_id = CAST(:uid AS uuid))
+      AND (CAST(:ids AS text[]) IS NULL OR m.gmail_msg_id = ANY(CAST(:ids AS text[])))
+    ORDER BY m.id
+    LIMIT :n
+    FOR UPDATE OF m SKIP LOCKED
+),
+scored AS (
+    SELECT
+        m.id,
+        CASE
+            WHEN 'CATEGORY_PROMOTIONS' = ANY(m.labels) THEN :promotion_id
+            WHEN near.sims[1] >= :threshold THEN near.topic_ids[1]
+        END AS cat,
+        near.sims[1] AS best_sim,
+        near.sims[2] AS second_sim
+    FROM batch AS b
+    JOIN mail_embeddings AS m ON m.id = b.id
+    LEFT JOIN LATERAL (
+        SELECT
+            array_agg(n.topic_id ORDER BY n.dist) AS topic_ids,
+            array_agg(1 - n.dist ORDER BY n.dist) AS sims
+        FROM (
+            SELECT t.topic_id, t.vector <=> m.vector AS dist
+            FROM major_topic_embedding AS t
+            WHERE t.embed_model = m.embed_model
+            ORDER BY dist
+            LIMIT 2
+        ) AS n
+    ) AS near ON true
+)
+UPDATE mail_embeddings AS m
+SET category = s.cat,
+    best_sim = s.best_sim,
+    second_sim = s.second_sim,
+    classified_at = statement_timestamp()
+FROM scored AS s
+WHERE m.id = s.id
+"""
+
+
+def classify_pending_in_db(
+    db: Session,
+    user_id: Optional[str] = None,
+    gmail_msg_ids: Optional[List[str]] = None,
+    chunk_size: Optional[int] = None,
+) -> int:
+    """
+    classify_pending과 같은 결과를 DB 안에서 계산.
+    잠금 시간을 짧게 유지하도록 청크마다 커밋하고, 분류한 메일 수를 반환.
+    """
+    chunk_size = chunk_size or Config.ANALYSIS_CHUNK_SIZE
+    params = {
+        "uid": user_id,
+        "ids": gmail_msg_ids,
+        "n": chunk_size,
+        "promotion_id": PROMOTION_ID,
+        "threshold": SIM_THRESHOLD,
+    }
+    total = 0
+    while True:
+        # 분류된 메일은 classified_at이 채워져 다음 청크에서 빠짐
+        updated = db.execute(text(_CLASSIFY_IN_DB_SQL), params).rowcount
+        db.commit()
+        total += updated
+        if updated < chunk_size:
+            return total
+
+
+# 정규화된 대주제 벡터가 t → t'로 바뀌면 모든 메일의 코사인 유사도는 최대 ‖t' - t‖만큼 움직임
+# → best - second 차이가 바뀐 대주제들의 변화량(상위 2개 합)보다 작거나
+#   best가 기준값에서 최대 변화량 이내인 메일만 결과가 뒤집힐 수 있음
+_FLIP_EPS = 1e-3  # halfvec 반올림 오차 여유
+
+
+def _topic_shift(vector, scored_vector) -> float:
+    if scored_vector is None:
+        # 새로 추가된 대주제 → 모든 메일이 영향받을 수 있음
+        return math.inf
+    a, b = vector_to_array(vector), vector_to_array(scored_vector)
+    a = a / (np.linalg.norm(a) + 1e-10)
+    b = b / (np.linalg.norm(b) + 1e-10)
+    return float(np.linalg.norm(a - b))
 
-        for mail_id, mail_vec_list, mail_labels in mail_rows:
-            if "CATEGORY_PROMOTIONS" in mail_labels:
-                assigned_cat = PROMOTION_ID
-            elif mail_vec_list is None or len(mail_vec_list) == 0:
-                assigned_cat = None
-            else:
-                mail_vec = np.array(mail_vec_list, dtype=float)  # (384,)
-
-                # 각 대주제 벡터와 코사인 유사도 계산
-                sims = np.array(
-                    [cosine_similarity(mail_vec, tv) for tv in topic_vecs]
-                )  # (4,)
-                max_idx = int(np.argmax(sims))  # 0~3
-                max_sim = float(sims[max_idx])
-
-                # 기준 이상이면 해당 topic_id, 아니면 others
-                if max_sim >= SIM_THRESHOLD:
-                    assigned_cat = topic_ids[max_idx]  # 1~4
-                else:
-                    assigned_cat = None
 
+def reclassify_changed_topics(db: Session) -> int:
+    """
+    scored_vector(기존 분류 기준)와 달라진 대주제가 있으면, 그 이전에 분류된 메일 중
+    결과가 바뀔 수 있는 메일만 classified_at을 비워 다시 분류 대상으로 만듦.
+    category는 다시 분류될 때까지 그대로 유지. 되돌린 메일 수를 반환.
+    """
+    rows = db.query(
+        MajorTopicEmbedding.embed_model,
+        MajorTopicEmbedding.topic_id,
+        MajorTopicEmbedding.vector,
+        MajorTopicEmbedding.scored_vector,
+        MajorTopicEmbedding.updated_at,
+    ).all()
+
+    changed: Dict[str, List] = {}
+    for r in rows:
+        if r.scored_vector is None or not np.array_equal(
+            vector_to_array(r.vector), vector_to_array(r.scored_vector)
+        ):
+            changed.setdefault(r.embed_model, []).append(r)
+
+    reset = 0
+    for model, topics in changed.items():
+        shifts = sorted(_topic_shift(t.vector, t.scored_vector) for t in topics)
+        max_shift = shifts[-1] + _FLIP_EPS
+        margin = sum(shifts[-2:]) + _FLIP_EPS
+        since = max(t.updated_at for t in topics)
+
+        if math.isinf(max_shift):
+            flip = "true"
+        else:
+            flip = """
+                best_sim IS NULL
+                OR best_sim - COALESCE(second_sim, -1) < :margin
+                OR abs(best_sim - :threshold) < :max_shift
+            """
+        result = db.execute(
+            text(
+                f"""
+                UPDATE mail_embeddings
+                SET classified_at = NULL
+                WHERE embed_model = :model
+                  AND NOT is_deleted
+                  AND vector IS NOT NULL
+                  AND classified_at < :since
+                  AND ({flip})
+                """
+            ),
+            {
+                "model": model,
+                "since": since,
+                "margin": margin,
+                "max_shift": max_shift,
+                "threshold": SIM_THRESHOLD,
+            },
+        )
+        # 읽은 뒤에 또 바뀐 대주제는 다음 실행에서 처리
+        for t in topics:
             db.execute(
                 text(
                     """
-                    UPDATE mail_embeddings
-                    SET category = :cat
-                    WHERE id = :mid
-                """
+                    UPDATE major_topic_embedding
+                    SET scored_vector = vector
+                    WHERE topic_id = :topic_id
+                      AND embed_model = :model
+                      AND updated_at = :updated_at
+                    """
                 ),
-                {"cat": assigned_cat, "mid": str(mail_id)},
+                {"topic_id": t.topic_id, "model": model, "updated_at": t.updated_at},
             )
-
-        db.commit()
-    except Exception:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+        reset += result.rowcount
+        logger.info(
+            f"[reclassify] {model} 대주제 {len(topics)}개 변경 "
+            f"(최대 변화량 {max_shift:.4f}) → {result.rowcount}개 재분류 대상"
+        )
+    return reset
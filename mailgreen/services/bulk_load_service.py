@@ -0,0 +1,115 @@
+import csv
+import io
+from typing import List
+
+from sqlalchemy.orm import Session
+
+# COPY 대상 컬럼 (순서가 CSV 행 순서와 같아야 함)
+MAIL_COLUMNS = [
+    "user_id",
+    "gmail_msg_id",
+    "sender",
+    "subject",
+    "snippet",
+    "labels",
+    "size_bytes",
+    "is_read",
+    "is_starred",
+    "received_at",
+    "vector",
+    "embed_model",
+    "processed_at",
+]
+
+# 충돌 시 갱신할 컬럼 (category / is_deleted 등 사용자·분류 상태는 유지)
+_UPDATE_COLUMNS = [c for c in MAIL_COLUMNS if c not in ("user_id", "gmail_msg_id")]
+
+# 벡터가 바뀐 행은 이전 벡터로 낸 분류 결과가 맞지 않으므로 분류 대기로 되돌림
+_RESET_CLASSIFIED = (
+    "classified_at = CASE WHEN mail_embeddings.vector IS DISTINCT FROM "
+    "EXCLUDED.vector THEN NULL ELSE mail_embeddings.classified_at END"
+)
+
+_STAGE_TABLE = "mail_embeddings_stage"
+
+
+def _pg_array(values) -> str:
+    # TEXT[] 리터럴: {"a","b"}
+    escaped = (
+        '"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _pg_vector(values) -> str:
+    # pgvector 리터럴: [0.1,0.2,...]
+    # float32 행을 그대로 포맷 (float64로 바꾸면 자릿수만 늘어남)
+    return "[" + ",".join(map("{:.7g}".format, values)) + "]"
+
+
+def _to_copy_value(column: str, value):
+    if value is None:
+        return None
+    if column == "labels":
+        return _pg_array(value)
+    if column == "vector":
+        return _pg_vector(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _write_csv(records: List[dict]) -> io.StringIO:
+    buf = io.StringIO()
+    # None만 따옴표 없이 비워서 NULL로, 빈 문자열은 ""로 구분
+    writer = csv.writer(buf, quoting=csv.QUOTE_NOTNULL)
+    for rec in records:
+        writer.writerow([_to_copy_value(c, rec.get(c)) for c in MAIL_COLUMNS])
+    buf.seek(0)
+    return buf
+
+
+def upsert_mail_embeddings(db: Session, records: List[dict]) -> int:
+    """
+    records를 COPY로 임시 staging 테이블에 넣은 뒤
+    INSERT ... ON CONFLICT (user_id, gmail_msg_id) DO UPDATE로 병합.
+    커밋은 호출하는 쪽에서 청크 단위로 수행.
+    """
+    if not records:
+        return 0
+
+    cols = ", ".join(MAIL_COLUMNS)
+    updates = ", ".join(
+        [f"{c} = EXCLUDED.{c}" for c in _UPDATE_COLUMNS] + [_RESET_CLASSIFIED]
+    )
+
+    raw = db.connection().connection
+    cur = raw.cursor()
+    try:
+        # 세션(커넥션) 단위 임시 테이블, 커밋 시 자동으로 비워짐
+        cur.execute(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS {_STAGE_TABLE}
+            (LIKE mail_embeddings INCLUDING DEFAULTS)
+            ON COMMIT DELETE ROWS
+            """
+        )
+        # 같은 트랜잭션에서 두 번 호출되는 경우 대비
+        cur.execute(f"TRUNCATE {_STAGE_TABLE}")
+        cur.copy_expert(
+            f"COPY {_STAGE_TABLE} ({cols}) FROM STDIN WITH (FORMAT csv)",
+            _write_csv(records),
+        )
+        # 같은 청크 안의 중복 id는 하나만 남겨야 ON CONFLICT가 실패하지 않음
+        cur.execute(
+            f"""
+            INSERT INTO mail_embeddings ({cols})
+            SELECT DISTINCT ON (user_id, gmail_msg_id) {cols}
+            FROM {_STAGE_TABLE}
+            ORDER BY user_id, gmail_msg_id, processed_at DESC
+            ON CONFLICT (user_id, gmail_msg_id) DO UPDATE SET {updates}
+            """
+        )
+        return cur.rowcount
+    finally:
+        cur.close()
@@ -0,0 +1,185 @@
+import logging
+import os
+import sys
+from typing import List, Optional
+
+import numpy as np
+
+from mailgreen.app.config import Config
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = Config.EMBED_MODEL_NAME
+
+TORCH = "torch"
+ONNX = "onnx"
+
+
+def model_id(backend: Optional[str] = None) -> str:
+    # 캐시 키와 mail_embeddings.embed_model에 쓰는 식별자
+    # (양자화 모델은 출력이 조금 달라서 구분)
+    backend = backend or Config.EMBED_BACKEND
+    if backend == ONNX:
+        return f"{MODEL_NAME}#onnx-qint8-{Config.EMBED_ONNX_QUANT}"
+    return MODEL_NAME
+
+
+def _onnx_file_name() -> str:
+    return f"onnx/model_qint8_{Config.EMBED_ONNX_QUANT}.onnx"
+
+
+def _onnx_dir(model_dir: Optional[str] = None) -> str:
+    model_dir = model_dir or Config.EMBED_ONNX_DIR
+    if not model_dir or not os.path.isabs(model_dir):
+        raise RuntimeError(
+            f"EMBED_ONNX_DIR는 절대 경로여야 합니다 (현재: {model_dir!r})"
+        )
+    return model_dir
+
+
+def export_quantized_onnx(model_dir: Optional[str] = None) -> str:
+    """
+    원본 모델을 ONNX로 내보낸 뒤 동적 int8 양자화해서 model_dir에 저장.
+    모델 다운로드가 필요하므로 워커가 아니라 배포 단계에서 한 번 실행.
+    optimum[onnxruntime]는 onnx extra로 설치 (poetry install -E onnx).
+    """
+    from sentence_transformers import (
+        SentenceTransformer,
+        export_dynamic_quantized_onnx_model,
+    )
+
+    model_dir = _onnx_dir(model_dir)
+    model = SentenceTransformer(MODEL_NAME, backend=ONNX)
+    model.save(model_dir)
+    export_dynamic_quantized_onnx_model(model, Config.EMBED_ONNX_QUANT, model_dir)
+    logger.info(f"[embed_backend] 양자화 ONNX 모델 저장: {model_dir}/{_onnx_file_name()}")
+    return model_dir
+
+
+def load_model(backend: Optional[str] = None):
+    from sentence_transformers import SentenceTransformer
+
+    backend = backend or Config.EMBED_BACKEND
+    if backend == TORCH:
+        return SentenceTransformer(MODEL_NAME)
+    if backend == ONNX:
+        # 워커 안에서 내보내지 않음 (네트워크/쓰기 권한 필요) → 없으면 바로 실패
+        model_dir = _onnx_dir()
+        if not os.path.exists(os.path.join(model_dir, _onnx_file_name())):
+            raise RuntimeError(
+                f"양자화 ONNX 모델이 없습니다: {model_dir}/{_onnx_file_name()} "
+                f"(python -m mailgreen.services.embed_backend export 먼저 실행)"
+            )
+        return SentenceTransformer(
+            model_dir,
+            backend=ONNX,
+            model_kwargs={
+                "file_name": _onnx_file_name(),
+                "provider": "CPUExecutionProvider",
+            },
+        )
+    raise ValueError(f"Unknown EMBED_BACKEND: {backend!r}")
+
+
+def _sample_texts(limit: int) -> List[str]:
+    # 실제 메일 제목+스니펫 표본 (run_analysis와 같은 입력 형태)
+    from sqlalchemy import text
+
+    from mailgreen.app.database import SessionLocal
+    from mailgreen.services.embed_service import prepare_text
+
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            text(
+                """
+                SELECT subject, snippet FROM mail_embeddings
+                ORDER BY random() LIMIT :n
+                """
+            ),
+            {"n": limit},
+        ).all()
+        return [prepare_text(r.subject, r.snippet) for r in rows]
+    finally:
+        db.close()
+
+
+def _topic_vectors() -> np.ndarray:
+    from mailgreen.app.database import SessionLocal
+    from mailgreen.app.models import MajorTopicEmbedding
+    from mailgreen.services.assign_topic_service import vector_to_array
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(MajorTopicEmbedding.vector)
+            .filter(MajorTopicEmbedding.embed_model == model_id(TORCH))
+            .all()
+        )
+        return np.array([vector_to_array(r.vector) for r in rows], dtype=np.float32)
+    finally:
+        db.close()
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    return m / (np.linalg.norm(m, axis=1, keepdims=True) + 1e-10)
+
+
+def verify_agreement(
+    texts: Optional[List[str]] = None,
+    sample_size: int = 500,
+    min_cosine: float = 0.98,
+    check_topics: bool = True,
+    min_topic_agreement: Optional[float] = None,
+) -> dict:
+    """
+    torch 출력과 양자화 ONNX 출력의 코사인 일치도를 표본으로 확인.
+    check_topics면 대주제 최근접 결과가 얼마나 같은지도 함께 계산해서
+    통과 기준에 포함 (대주제 벡터가 없으면 계산할 수 없으므로 실패).
+    """
+    if min_topic_agreement is None:
+        min_topic_agreement = Config.EMBED_ONNX_MIN_TOPIC_AGREEMENT
+    texts = texts or _sample_texts(sample_size)
+    if not texts:
+        raise ValueError("비교할 텍스트가 없습니다.")
+
+    ref = _normalize(
+        np.asarray(load_model(TORCH).encode(texts, convert_to_numpy=True), np.float32)
+    )
+    cand = _normalize(
+        np.asarray(load_model(ONNX).encode(texts, convert_to_numpy=True), np.float32)
+    )
+    cos = np.einsum("ij,ij->i", ref, cand)
+
+    report = {
+        "samples": len(texts),
+        "cosine_mean": float(cos.mean()),
+        "cosine_min": float(cos.min()),
+        "cosine_p01": float(np.percentile(cos, 1)),
+    }
+    if check_topics:
+        topics = _topic_vectors()
+        if len(topics):
+            topics = _normalize(topics)
+            same = (ref @ topics.T).argmax(axis=1) == (cand @ topics.T).argmax(axis=1)
+            report["topic_agreement"] = float(same.mean())
+    passed = report["cosine_min"] >= min_cosine
+    if check_topics:
+        agreement = report.get("topic_agreement")
+        passed = passed and agreement is not None and agreement >= min_topic_agreement
+    report["passed"] = passed
+    return report
+
+
+if __name__ == "__main__":
+    # python -m mailgreen.services.embed_backend export [절대 경로]|verify
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    if cmd == "export":
+        print(export_quantized_onnx(*sys.argv[2:3]))
+    elif cmd == "verify":
+        report = verify_agreement()
+        print(report)
+        if not report["passed"]:
+            raise SystemExit(1)
+    else:
+        raise SystemExit(f"unknown command: {cmd}")
@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import redis
+
+from mailgreen.app.config import Config
+from mailgreen.app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_WS_RE = re.compile(r"\s+")
+
+_REDIS_PREFIX = "embcache:v:"
+_REDIS_INDEX = "embcache:index"  # key → 마지막 사용 시각 (크기 제한용)
+_REDIS_STATS = "embcache:stats"
+
+
+def normalize_text(text: Optional[str]) -> str:
+    # 모델 입력 자체를 정규화 (대소문자는 모델이 구분하므로 유지)
+    if not text:
+        return ""
+    return _WS_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(text: str, model_id: str) -> str:
+    return hashlib.blake2b(
+        f"{model_id}\0{text}".encode(), digest_size=16
+    ).hexdigest()
+
+
+class _LRU:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is not None:
+                self._data.move_to_end(key)
+            return vec
+
+    def put(self, key: str, vec: np.ndarray) -> None:
+        with self._lock:
+            self._data[key] = vec
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+_local = _LRU(Config.EMBED_CACHE_LOCAL_SIZE)
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {
+    "local_hits": 0,
+    "redis_hits": 0,
+    "misses": 0,
+    "batch_dupes": 0,
+}
+# 아직 Redis로 보내지 않은 증가분 (임베딩 호출마다 Redis를 왕복하지 않도록 모아서 전송)
+_unflushed: Dict[str, int] = dict.fromkeys(_stats, 0)
+_last_flush = time.monotonic()
+
+
+def _count(**deltas: int) -> None:
+    with _stats_lock:
+        for k, v in deltas.items():
+            _stats[k] += v
+            _unflushed[k] += v
+        due = time.monotonic() - _last_flush >= Config.EMBED_CACHE_STATS_FLUSH_SEC
+    if due:
+        flush_cache_stats()
+
+
+def flush_cache_stats() -> None:
+    """
+    모아둔 카운터를 Redis에 누적 (주기적으로, 그리고 작업/프로세스 종료 시).
+    캐시 계층과 무관하게 Redis에 모아야 API 프로세스에서 워커 통계를 볼 수 있음.
+    """
+    global _last_flush
+    with _stats_lock:
+        pending = {k: v for k, v in _unflushed.items() if v}
+        for k in pending:
+            _unflushed[k] = 0
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for k, v in pending.items():
+            pipe.hincrby(_REDIS_STATS, k, v)
+        pipe.execute()
+    except redis.RedisError as e:
+        # 통계 때문에 임베딩이 실패하지 않도록 다음 전송으로 미룸
+        with _stats_lock:
+            for k, v in pending.items():
+                _unflushed[k] += v
+        logger.warning(f"[embed_cache] 통계 전송 실패: {e}")
+
+
+def get_cache_stats() -> dict:
+    """이 프로세스의 카운터 + 전체 워커 누적 카운터 (+ Redis 계층 항목 수)."""
+    with _stats_lock:
+        stats = {"process": dict(_stats)}
+    stats["cluster"] = {k: int(v) for k, v in get_redis().hgetall(_REDIS_STATS).items()}
+    if Config.EMBED_CACHE_REDIS:
+        stats["redis_entries"] = get_redis().zcard(_REDIS_INDEX)
+    return stats
+
+
+def _redis_get(keys: List[str]) -> Dict[str, np.ndarray]:
+    r = get_redis(decode_responses=False)
+    raw = r.mget([_REDIS_PREFIX + k for k in keys])
+    # float32 바이트를 그대로 저장하므로 길이가 곧 차원
+    found = {
+        k: np.frombuffer(v, dtype=np.float32)
+        for k, v in zip(keys, raw)
+        if v is not None
+    }
+    if found:
+        get_redis().zadd(_REDIS_INDEX, {k: time.time() for k in found})
+    return found
+
+
+def _redis_put(items: Dict[str, np.ndarray]) -> None:
+    r = get_redis(decode_responses=False)
+    now = time.time()
+    pipe = r.pipeline(transaction=False)
+    for k, vec in items.items():
+        pipe.set(_REDIS_PREFIX + k, vec.astype(np.float32).tobytes())
+    pipe.zadd(_REDIS_INDEX, {k: now for k in items})
+    pipe.execute()
+
+    # 최대 항목 수를 넘으면 가장 오래 안 쓴 것부터 제거
+    overflow = r.zcard(_REDIS_INDEX) - Config.EMBED_CACHE_REDIS_SIZE
+    if overflow > 0:
+        evicted = [k.decode() for k, _ in r.zpopmin(_REDIS_INDEX, overflow)]
+        if evicted:
+            r.delete(*[_REDIS_PREFIX + k for k in evicted])
+
+
+def cached_encode(
+    texts: List[str],
+    encode: Callable[[List[str]], np.ndarray],
+    model_id: str,
+    dim: Callable[[], int],
+) -> np.ndarray:
+    """
+    정규화 텍스트 해시로 캐시를 조회하고, 배치 안 중복은 한 번만 인코딩.
+    encode는 고유 텍스트 목록을 받아 (n, dim) float32 배열을 돌려줘야 함.
+    dim은 빈 입력일 때만 호출 (모두 캐시 적중이면 모델을 로드하지 않도록).
+    """
+    normed = [normalize_text(t) for t in texts]
+    keys = [cache_key(t, model_id) for t in normed]
+
+    # 배치 안 중복 제거: key → 처음 나온 위치들
+    positions: Dict[str, List[int]] = {}
+    for i, k in enumerate(keys):
+        positions.setdefault(k, []).append(i)
+
+    resolved: Dict[str, np.ndarray] = {}
+    local_hits = 0
+    for k in positions:
+        vec = _local.get(k)
+        if vec is not None:
+            resolved[k] = vec
+            local_hits += 1
+
+    redis_hits = 0
+    if Config.EMBED_CACHE_REDIS:
+        pending = [k for k in positions if k not in resolved]
+        if pending:
+            found = _redis_get(pending)
+            for k, vec in found.items():
+                _local.put(k, vec)
+            resolved.update(found)
+            redis_hits = len(found)
+
+    missing = [k for k in positions if k not in resolved]
+    if missing:
+        vecs = encode([normed[positions[k][0]] for k in missing])
+        # 행 view를 그대로 보관하면 청크 배열 전체가 메모리에 남으므로 복사
+        fresh = {k: vecs[j].copy() for j, k in enumerate(missing)}
+        for k, vec in fresh.items():
+            _local.put(k, vec)
+        if Config.EMBED_CACHE_REDIS:
+            _redis_put(fresh)
+        resolved.update(fresh)
+
+    if not resolved:
+        return np.empty((0, dim()), dtype=np.float32)
+    out = np.empty((len(texts), len(next(iter(resolved.values())))), dtype=np.float32)
+    for k, idx in positions.items():
+        out[idx] = resolved[k]
+
+    _count(
+        local_hits=local_hits,
+        redis_hits=redis_hits,
+        misses=len(missing),
+        batch_dupes=len(texts) - len(positions),
+    )
+    return out
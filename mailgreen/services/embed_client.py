@@ -0,0 +1,47 @@
+import threading
+from typing import List, Optional
+from urllib.parse import urlparse
+
+import httpx
+import numpy as np
+
+from mailgreen.app.config import Config
+from mailgreen.services.embed_backend import model_id
+
+# 노드 임베딩 서버(embed_server) 클라이언트, 프로세스당 커넥션 풀 하나
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+def _get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                url = Config.EMBED_SERVER_URL
+                timeout = Config.EMBED_SERVER_TIMEOUT_SEC
+                parsed = urlparse(url)
+                if parsed.scheme == "unix":
+                    _client = httpx.Client(
+                        transport=httpx.HTTPTransport(uds=parsed.path),
+                        base_url="http://embed-server",
+                        timeout=timeout,
+                    )
+                else:
+                    _client = httpx.Client(base_url=url, timeout=timeout)
+    return _client
+
+
+def remote_embedding(texts: List[str]) -> np.ndarray:
+    """embed_server에 인코딩을 맡기고 (n, dim) float32 배열을 받음."""
+    resp = _get_client().post("/embed", json={"texts": texts})
+    resp.raise_for_status()
+
+    # embed_model 컬럼에 기록하는 값과 서버 모델이 다르면 버전이 섞이므로 거부
+    server_model = resp.headers["X-Embed-Model"]
+    if server_model != model_id():
+        raise RuntimeError(
+            f"임베딩 서버 모델 {server_model} != 설정 모델 {model_id()}"
+        )
+    dim = int(resp.headers["X-Embed-Dim"])
+    return np.frombuffer(resp.content, dtype=np.float32).reshape(len(texts), dim)
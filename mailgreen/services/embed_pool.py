@@ -0,0 +1,92 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+import numpy as np
+
+from mailgreen.app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# sentence-transformers 멀티프로세스 풀 (프로세스당 하나, 처음 쓸 때 시작)
+_pool: Optional[dict] = None
+_pool_lock = threading.Lock()
+
+
+@contextmanager
+def _allow_children():
+    # Celery prefork 자식은 daemon 프로세스라 multiprocessing 자식을 만들 수 없음
+    # → 풀을 띄우는 동안만 daemon 플래그를 내림
+    config = multiprocessing.current_process()._config
+    daemon = config.pop("daemon", None)
+    try:
+        yield
+    finally:
+        if daemon is not None:
+            config["daemon"] = daemon
+
+
+@contextmanager
+def _threads_per_worker(size: int):
+    # 각 풀 프로세스가 모든 코어를 쓰려고 하면 오히려 느려지므로 나눠 줌
+    keys = ("OMP_NUM_THREADS", "MKL_NUM_THREADS")
+    saved = {k: os.environ.get(k) for k in keys}
+    per_worker = str(max(1, (os.cpu_count() or size) // size))
+    for k in keys:
+        os.environ[k] = per_worker
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def pool_enabled(n_texts: int) -> bool:
+    return (
+        Config.EMBED_POOL_SIZE > 1
+        and Config.EMBED_BACKEND == "torch"
+        and n_texts >= Config.EMBED_POOL_MIN_TEXTS
+    )
+
+
+def get_pool(model) -> dict:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                size = Config.EMBED_POOL_SIZE
+                with _allow_children(), _threads_per_worker(size):
+                    _pool = model.start_multi_process_pool(
+                        target_devices=["cpu"] * size
+                    )
+                atexit.register(stop_pool)
+                logger.info(f"[embed_pool] {size}개 프로세스로 임베딩 풀 시작")
+    return _pool
+
+
+def stop_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            from sentence_transformers import SentenceTransformer
+
+            SentenceTransformer.stop_multi_process_pool(_pool)
+            _pool = None
+
+
+def encode_with_pool(model, texts: List[str], batch_size: int) -> np.ndarray:
+    """입력을 여러 코어에 나눠 인코딩하고 원래 순서대로 합친 float32 배열을 반환."""
+    vecs = model.encode_multi_process(
+        texts,
+        get_pool(model),
+        batch_size=batch_size,
+        chunk_size=Config.EMBED_POOL_CHUNK,
+    )
+    return np.asarray(vecs, dtype=np.float32)
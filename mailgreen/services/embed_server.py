@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+from mailgreen.app.config import Config
+from mailgreen.services.embed_cache import flush_cache_stats
+
+logger = logging.getLogger(__name__)
+
+# 노드마다 하나 띄우는 임베딩 서버
+# Celery 워커 / API 프로세스의 작은 요청들을 짧은 시간 창 안에서 모아
+# 한 번의 forward로 처리 → 모델은 노드당 한 벌, 작은 증분 동기화도 큰 배치로 인코딩
+#
+#   EMBED_SERVER_URL=unix:///tmp/mailgreen-embed.sock \
+#       python -m mailgreen.services.embed_server
+#
+# POST /embed  {"texts": [...]} → float32 (n, dim) 바이트, X-Embed-Dim / X-Embed-Model 헤더
+# GET  /health → 모델 id와 배치 통계
+
+
+class _Request:
+    __slots__ = ("texts", "done", "result", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class DynamicBatcher:
+    """
+    submit된 요청을 큐에 쌓고 전용 스레드가 모아서 인코딩.
+    첫 요청이 들어온 뒤 window_sec 동안 또는 max_batch 텍스트가 찰 때까지 기다림.
+    인코딩 중에 들어온 요청은 다음 배치로 자연스럽게 합쳐짐.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], np.ndarray],
+        max_batch: int,
+        window_sec: float,
+    ):
+        self._encode = encode
+        self._max_batch = max_batch
+        self._window_sec = window_sec
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.stats = {"batches": 0, "requests": 0, "texts": 0}
+        self._thread = threading.Thread(
+            target=self._run, name="embed-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> np.ndarray:
+        req = _Request(texts)
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def _collect(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self._window_sec
+        while size < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(req)
+            size += len(req.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            texts = [t for req in batch for t in req.texts]
+            try:
+                vectors = self._encode(texts)
+            except Exception as e:
+                logger.error(f"[embed_server] 인코딩 실패: {e}", exc_info=True)
+                for req in batch:
+                    req.error = e
+                    req.done.set()
+                continue
+
+            pos = 0
+            for req in batch:
+                req.result = vectors[pos : pos + len(req.texts)]
+                pos += len(req.texts)
+                req.done.set()
+            with self._stats_lock:
+                self.stats["batches"] += 1
+                self.stats["requests"] += len(batch)
+                self.stats["texts"] += len(texts)
+
+
+def _make_handler(batcher: DynamicBatcher, embed_model: str, dim: int):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: bytes, content_type: str, **headers):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status: int, payload: dict):
+            self._send(status, json.dumps(payload).encode(), "application/json")
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._send_json(404, {"detail": "not found"})
+            stats = batcher.get_stats()
+            self._send_json(200, {"model": embed_model, "dim": dim, **stats})
+
+        def do_POST(self):
+            if self.path != "/embed":
+                return self._send_json(404, {"detail": "not found"})
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                texts = json.loads(self.rfile.read(length))["texts"]
+                # 잘못된 입력 하나가 같은 배치의 다른 요청까지 실패시키지 않도록 미리 검사
+                if not all(isinstance(t, str) for t in texts):
+                    raise TypeError
+            except (ValueError, KeyError, TypeError):
+                return self._send_json(400, {"detail": "texts 필드가 필요합니다."})
+
+            try:
+                vectors = batcher.submit(texts) if texts else np.empty((0, dim))
+            except Exception as e:
+                return self._send_json(500, {"detail": str(e)})
+            self._send(
+                200,
+                np.ascontiguousarray(vectors, dtype=np.float32).tobytes(),
+                "application/octet-stream",
+                **{"X-Embed-Dim": str(dim), "X-Embed-Model": embed_model},
+            )
+
+        def address_string(self):
+            # unix 소켓은 client_address가 비어 있음
+            return str(self.client_address or "unix")
+
+        def log_message(self, fmt, *args):
+            logger.debug(f"[embed_server] {self.address_string()} {fmt % args}")
+
+    return Handler
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(url: Optional[str] = None):
+    from mailgreen.services.embed_backend import model_id
+    from mailgreen.services.embed_service import get_model, local_embedding
+
+    url = url or Config.EMBED_SERVER_URL or "unix:///tmp/mailgreen-embed.sock"
+    model = get_model()
+    batcher = DynamicBatcher(
+        local_embedding,
+        Config.EMBED_SERVER_MAX_BATCH,
+        Config.EMBED_SERVER_WINDOW_MS / 1000,
+    )
+    handler = _make_handler(
+        batcher, model_id(), model.get_sentence_embedding_dimension()
+    )
+
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        # 이전 실행이 남긴 소켓 파일 정리
+        if os.path.exists(parsed.path):
+            os.unlink(parsed.path)
+        return _UnixHTTPServer(parsed.path, handler)
+    return ThreadingHTTPServer((parsed.hostname, parsed.port), handler)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    server = make_server()
+    logger.info(f"[embed_server] listening on {server.server_address}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        flush_cache_stats()
@@ -1,12 +1,142 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+import threading
+from typing import Iterator, List, Optional, Tuple
 
-_model = SentenceTransformer(
-    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-)
+import numpy as np
 
+from mailgreen.app.config import Config
+from mailgreen.services.embed_backend import load_model, model_id
+from mailgreen.services.embed_cache import cached_encode
+from mailgreen.services.embed_pool import encode_with_pool, pool_enabled
 
-def get_embedding(texts: List[str]) -> List[float]:
+# 모델은 처음 쓰일 때 로드 (API 프로세스는 import만으로 torch를 올리지 않음)
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                # EMBED_BACKEND 설정에 따라 torch 또는 양자화 ONNX 모델
+                _model = load_model()
+    return _model
+
+
+def preload_model() -> None:
+    """
+    Celery 부모 프로세스에서 fork 전에 호출.
+    자식 프로세스들이 모델 메모리를 copy-on-write로 공유하게 됨.
+    """
+    import gc
+
+    get_model()
+    # 이후 GC가 공유 페이지의 객체 헤더를 건드려 복사되지 않도록 고정
+    gc.freeze()
+
+
+def prepare_text(
+    subject: Optional[str], snippet: Optional[str], max_chars: Optional[int] = None
+) -> str:
+    # 메일 한 통의 임베딩 입력 (제목 + 스니펫)
+    # 길이 제한은 글자 수가 아니라 토큰 수 기준으로 _tokenize에서 처리
+    text = f"{subject} {snippet}"
+    return text[:max_chars] if max_chars else text
+
+
+def _tokenize(texts: List[str]):
+    # 모델 max_seq_length 토큰까지만 한 번 토큰화 → 길이 정렬과 forward에 재사용
+    model = get_model()
+    return model.tokenizer(
+        texts,
+        truncation=True,
+        max_length=model.max_seq_length,
+        return_attention_mask=False,
+    )
+
+
+def _forward(model, input_ids: List[List[int]]) -> np.ndarray:
+    # 이미 토큰화된 id로 바로 forward (encode()처럼 다시 토큰화하지 않음)
+    import torch
+    from sentence_transformers.util import batch_to_device
+
+    features = model.tokenizer.pad(
+        {"input_ids": input_ids}, padding=True, return_tensors="pt"
+    )
+    features = batch_to_device(features, model.device)
+    with torch.inference_mode():
+        emb = model.forward(features)["sentence_embedding"]
+    return emb.float().cpu().numpy()
+
+
+def iter_embeddings(
+    texts: List[str], batch_size: Optional[int] = None
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    토큰 길이순으로 정렬해 비슷한 길이끼리 마이크로배치로 인코딩.
+    (원래 인덱스, float32 벡터) 쌍을 배치마다 바로 흘려보냄.
+    """
+    batch_size = batch_size or Config.EMBED_BATCH_SIZE
     inputs = [t if t else "" for t in texts]  # None 혹은 빈 텍스트를 빈 문자열로 대체
-    vecs = _model.encode(inputs)
-    return [v.tolist() for v in vecs]
+    if not inputs:
+        return
+
+    model = get_model()
+    input_ids = _tokenize(inputs)["input_ids"]
+    lengths = np.fromiter(
+        (len(x) for x in input_ids), dtype=np.int32, count=len(inputs)
+    )
+    # 길이가 비슷한 텍스트끼리 묶어야 패딩 낭비가 줄어듦
+    order = np.argsort(lengths, kind="stable")
+    for start in range(0, len(order), batch_size):
+        idx = order[start : start + batch_size]
+        yield idx, _forward(model, [input_ids[i] for i in idx])
+
+
+def _encode(texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+    # 원래 순서대로 채운 (n, dim) float32 연속 배열 → Python list 변환 없이 DB로 전달
+    model = get_model()
+    out = np.empty(
+        (len(texts), model.get_sentence_embedding_dimension()),
+        dtype=np.float32,
+    )
+    if pool_enabled(len(texts)):
+        # 큰 청크는 여러 코어에 나눠서 인코딩
+        # 풀 프로세스는 문자열만 받아 직접 토큰화(max_seq_length에서 자름)하므로
+        # 여기서 미리 토큰화하지 않음 → 텍스트당 토큰화는 풀 쪽 한 번
+        # 청크끼리 길이가 비슷하도록 글자 수로 정렬 (청크 안은 encode가 토큰 길이순 정렬)
+        inputs = [t if t else "" for t in texts]
+        order = np.argsort([len(t) for t in inputs], kind="stable")
+        out[order] = encode_with_pool(
+            model,
+            [inputs[i] for i in order],
+            batch_size or Config.EMBED_BATCH_SIZE,
+        )
+        return out
+
+    for idx, vecs in iter_embeddings(texts, batch_size):
+        out[idx] = vecs
+    return out
+
+
+def get_embedding(texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+    if Config.EMBED_SERVER_URL:
+        # 노드 임베딩 서버가 다른 프로세스 요청과 합쳐서 인코딩 (모델은 서버에만 로드)
+        from mailgreen.services.embed_client import remote_embedding
+
+        return remote_embedding(texts)
+    return local_embedding(texts, batch_size)
+
+
+def local_embedding(texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+    # 이 프로세스의 모델로 인코딩 (embed_server도 이 경로를 사용)
+    if not Config.EMBED_CACHE_ENABLED:
+        return _encode(texts, batch_size)
+    # 같은 제목+스니펫이 반복되는 뉴스레터/알림은 캐시에서 바로 가져옴
+    # 모델은 캐시에 없는 텍스트가 있을 때만 로드 (_encode 안에서)
+    return cached_encode(
+        texts,
+        lambda uniq: _encode(uniq, batch_size),
+        model_id(),
+        lambda: get_model().get_sentence_embedding_dimension(),
+    )
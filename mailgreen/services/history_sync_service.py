@@ -0,0 +1,172 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+
+
+class HistoryDelta(NamedTuple):
+    added_ids: List[str]  # 메타데이터를 새로 가져와야 하는 메시지
+    label_updates: Dict[str, List[str]]  # 기존 메시지 id → 최종 labelIds
+    deleted_ids: List[str]  # 완전히 삭제된 메시지
+    history_id: Optional[str]  # 다음 동기화 시작점
+
+
+def collect_history_delta(service, start_history_id: str) -> HistoryDelta:
+    """
+    history().list의 모든 페이지를 순서대로 읽어 메시지별 최종 상태로 합침.
+    startHistoryId가 너무 오래되면 Gmail이 404를 반환하므로 호출 쪽에서 처리.
+    """
+    added: Dict[str, None] = {}  # 순서 유지용
+    labels: Dict[str, List[str]] = {}
+    deleted: Dict[str, None] = {}
+    history_id: Optional[str] = None
+    page_token: Optional[str] = None
+
+    while True:
+        resp = (
+            service.users()
+            .history()
+            .list(
+                userId="me",
+                startHistoryId=start_history_id,
+                historyTypes=HISTORY_TYPES,
+                pageToken=page_token,
+            )
+            .execute()
+        )
+        history_id = resp.get("historyId", history_id)
+
+        for h in resp.get("history", []):
+            for m in h.get("messagesAdded", []):
+                mid = m["message"]["id"]
+                deleted.pop(mid, None)
+                added[mid] = None
+            for key in ("labelsAdded", "labelsRemoved"):
+                for m in h.get(key, []):
+                    # 기록에 담긴 labelIds가 변경 직후의 전체 라벨 → 마지막 값이 최종 상태
+                    labels[m["message"]["id"]] = m["message"].get("labelIds", [])
+            for m in h.get("messagesDeleted", []):
+                mid = m["message"]["id"]
+                added.pop(mid, None)
+                labels.pop(mid, None)
+                deleted[mid] = None
+
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            break
+
+    # 새 메시지는 어차피 전체 메타데이터를 가져오므로 라벨 변경에서 제외
+    for mid in added:
+        labels.pop(mid, None)
+
+    return HistoryDelta(list(added), labels, list(deleted), history_id)
+
+
+def apply_label_updates(
+    db: Session, user_id: str, label_updates: Dict[str, List[str]], chunk_size: int
+) -> int:
+    # labels 배열은 unnest로 2차원을 펼칠 수 없어서 콤마로 이어 붙여 전달
+    items = list(label_updates.items())
+    updated = 0
+    for i in range(0, len(items), chunk_size):
+        chunk = items[i : i + chunk_size]
+        result = db.execute(
+            text(
+                """
+                UPDATE mail_embeddings AS m
+                SET labels = v.labels,
+                    is_read = NOT ('UNREAD' = ANY(v.labels)),
+                    is_starred = 'STARRED' = ANY(v.labels),
+                    is_deleted = 'TRASH' = ANY(v.labels),
+                    deleted_at = CASE
+                        WHEN 'TRASH' = ANY(v.labels) THEN COALESCE(m.deleted_at, NOW())
+                        ELSE NULL
+                    END
+                FROM (
+                    SELECT u.gmail_msg_id, string_to_array(u.labels, ',') AS labels
+                    FROM unnest(CAST(:ids AS text[]), CAST(:labels AS text[]))
+                        AS u(gmail_msg_id, labels)
+                ) AS v
+                WHERE m.user_id = :uid AND m.gmail_msg_id = v.gmail_msg_id
+                """
+            ),
+            {
+                "uid": user_id,
+                "ids": [mid for mid, _ in chunk],
+                "labels": [",".join(lbls) for _, lbls in chunk],
+            },
+        )
+        updated += result.rowcount
+    return updated
+
+
+def apply_deletes(
+    db: Session, user_id: str, deleted_ids: List[str], chunk_size: int
+) -> int:
+    updated = 0
+    for i in range(0, len(deleted_ids), chunk_size):
+        result = db.execute(
+            text(
+                """
+                UPDATE mail_embeddings
+                SET is_deleted = true, deleted_at = COALESCE(deleted_at, NOW())
+                WHERE user_id = :uid AND gmail_msg_id = ANY(:ids)
+                """
+            ),
+            {"uid": user_id, "ids": deleted_ids[i : i + chunk_size]},
+        )
+        updated += result.rowcount
+    return updated
+
+
+def mark_listed(
+    db: Session, user_id: str, ids: List[str], listed_at: datetime
+) -> int:
+    # 전체 재적재에서 목록에 나온 메일 표시 (메타데이터 조회에 실패한 것 포함)
+    result = db.execute(
+        text(
+            """
+            UPDATE mail_embeddings SET processed_at = :at
+            WHERE user_id = :uid AND gmail_msg_id = ANY(:ids)
+            """
+        ),
+        {"uid": user_id, "ids": list(ids), "at": listed_at},
+    )
+    return result.rowcount
+
+
+def delete_unlisted(db: Session, user_id: str, since: datetime) -> int:
+    """
+    전체 재적재 동안 목록에 한 번도 나오지 않은 메일을 삭제 처리.
+    messages.list는 휴지통/스팸을 빼고 돌려주므로 Gmail에서 지운 메일과 같음.
+    """
+    result = db.execute(
+        text(
+            """
+            UPDATE mail_embeddings
+            SET is_deleted = true, deleted_at = COALESCE(deleted_at, NOW())
+            WHERE user_id = :uid AND NOT is_deleted
+              AND (processed_at IS NULL OR processed_at < :since)
+            """
+        ),
+        {"uid": user_id, "since": since},
+    )
+    logger.info(f"[history_sync] user={user_id} unlisted_deleted={result.rowcount}")
+    return result.rowcount
+
+
+def apply_history_delta(
+    db: Session, user_id: str, delta: HistoryDelta, chunk_size: int = 500
+) -> None:
+    labeled = apply_label_updates(db, user_id, delta.label_updates, chunk_size)
+    removed = apply_deletes(db, user_id, delta.deleted_ids, chunk_size)
+    logger.info(
+        f"[history_sync] user={user_id} added={len(delta.added_ids)} "
+        f"label_updated={labeled} deleted={removed}"
+    )
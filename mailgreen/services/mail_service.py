@@ -1,19 +1,28 @@
 import logging
-import time
 import random
+import threading
+import time
 
 from datetime import datetime, timezone
-from typing import List, Optional, Any
+from typing import List, Optional, Any, Iterable, Iterator, NamedTuple, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from urllib.error import HTTPError
 
 from googleapiclient.errors import HttpError
+from sqlalchemy import select
 from sqlalchemy.orm import Session, Query
 
+from mailgreen.app.config import Config
 from mailgreen.app.models import MailEmbedding, AnalysisTask
+from mailgreen.services.rate_limiter import AdaptiveTokenBucket
 from dateutil.relativedelta import relativedelta
 
 logger = logging.getLogger(__name__)
 
+# Gmail 배치 요청 크기 범위 (API 상한 100)
+MIN_BATCH_SIZE = 5
+MAX_BATCH_SIZE = 100
+
 
 def filter_mails(
     query: Query,
@@ -57,35 +66,81 @@ def filter_mails(
 def start_analysis_task(db: Session, user_id: str) -> dict[str, str | None | Any]:
     import uuid
     from datetime import datetime, timezone
-    from mailgreen.tasks.mail_analysis import run_analysis
+    from mailgreen.services.analysis_lock_service import (
+        acquire_analysis_lock,
+        release_analysis_lock,
+    )
+    from mailgreen.tasks.scheduler import enqueue_analysis
 
-    # 이전에 실행된 Task 중 history_id가 있는 가장 최근 것 가져오기
-    last = (
+    # 체크포인트를 남기고 실패한 Task가 있으면 새로 만들지 않고 이어서 실행
+    latest = (
         db.query(AnalysisTask)
-        .filter(AnalysisTask.user_id == user_id, AnalysisTask.history_id.isnot(None))
+        .filter(AnalysisTask.user_id == user_id)
         .order_by(AnalysisTask.started_at.desc())
         .first()
     )
-    start_history = last.history_id if last else None
-
-    task_id = str(uuid.uuid4())
-    task = AnalysisTask(
-        id=task_id,
-        user_id=user_id,
-        task_type="email-analysis",
-        status="pending",
-        progress_pct=0,
-        started_at=datetime.utcnow(),
-        history_id=start_history,
-    )
-    db.add(task)
-    db.commit()
+    resume = latest and latest.status == "failed" and latest.last_chunk > 0
+    task_id = str(latest.id) if resume else str(uuid.uuid4())
+
+    # 사용자당 분석은 하나만 실행 → 실행 중이면 그 작업 id를 돌려주고
+    # 끝난 뒤 한 번 더 돌도록 재실행 플래그만 남김
+    active_id = acquire_analysis_lock(user_id, task_id)
+    if active_id:
+        active = db.query(AnalysisTask).get(active_id)
+        return {
+            "task_id": active_id,
+            "start_history_id": (active.history_id if active else None) or "",
+            "already_running": True,
+        }
+
+    try:
+        if resume:
+            latest.status = "pending"
+            latest.error_msg = None
+            latest.finished_at = None
+            db.commit()
+            # 이후 조각은 Celery id가 달라지므로 진행률은 AnalysisTask id로 조회
+            enqueue_analysis(user_id, task_id, latest.history_id)
+            return {
+                "task_id": task_id,
+                "start_history_id": latest.history_id or "",
+                "already_running": False,
+            }
+
+        # 이전에 실행된 Task 중 history_id가 있는 가장 최근 것 가져오기
+        last = (
+            db.query(AnalysisTask)
+            .filter(
+                AnalysisTask.user_id == user_id, AnalysisTask.history_id.isnot(None)
+            )
+            .order_by(AnalysisTask.started_at.desc())
+            .first()
+        )
+        start_history = last.history_id if last else None
+
+        task = AnalysisTask(
+            id=task_id,
+            user_id=user_id,
+            task_type="email-analysis",
+            status="pending",
+            progress_pct=0,
+            started_at=datetime.utcnow(),
+            history_id=start_history,
+        )
+        db.add(task)
+        db.commit()
 
-    # Celery 비동기 작업 호출
-    async_result = run_analysis.apply_async(args=[user_id, task_id, start_history])
-    celery_task_id = async_result.id
+        # 스케줄러 대기열에 넣고, 차례가 되면 Celery 작업으로 실행됨
+        enqueue_analysis(user_id, task_id, start_history)
+    except Exception:
+        release_analysis_lock(user_id, task_id)
+        raise
 
-    return {"task_id": celery_task_id, "start_history_id": start_history or ""}
+    return {
+        "task_id": task_id,
+        "start_history_id": start_history or "",
+        "already_running": False,
+    }
 
 
 def get_analysis_progress(db: Session, user_id: str) -> dict:
@@ -110,28 +165,76 @@ def get_analysis_progress(db: Session, user_id: str) -> dict:
     return response
 
 
-def list_all_message_ids(service) -> List[str]:
-    ids: List[str] = []
-    page_token: Optional[str] = None
+# AnalysisTask.status → 기존 /progress 응답의 Celery 상태 이름
+_TASK_STATES = {
+    "pending": "PENDING",
+    "running": "PROGRESS",
+    "retrying": "RETRY",
+    "done": "SUCCESS",
+    "failed": "FAILURE",
+}
+
+
+def get_task_progress(db: Session, task_id: str) -> dict:
+    # 초기 적재는 여러 Celery 작업(조각)으로 나뉘므로 Celery 상태 대신
+    # 조각 전체가 공유하는 AnalysisTask 행을 기준으로 진행률을 돌려줌
+    task = db.query(AnalysisTask).get(task_id)
+    if not task:
+        return {"state": "PENDING", "meta": {}}
+
+    meta = {
+        "processed": task.processed_count,
+        "progress_pct": task.progress_pct or 0,
+    }
+    if task.status == "failed":
+        meta["error_msg"] = task.error_msg
+    return {"state": _TASK_STATES.get(task.status, "PENDING"), "meta": meta}
+
+
+def iter_message_id_pages(
+    service, page_size: int = 500, page_token: Optional[str] = None
+) -> Iterator[Tuple[List[str], Optional[str]]]:
+    # messages.list 한 페이지씩 (id 목록, 다음 페이지 토큰)을 흘려보냄
+    # page_token을 넘기면 해당 페이지부터 이어서 조회
     while True:
         resp = (
             service.users()
             .messages()
             .list(
                 userId="me",
-                maxResults=500,
+                maxResults=page_size,
                 pageToken=page_token,
                 fields="nextPageToken,messages(id)",
             )
             .execute()
         )
-        ids.extend(m["id"] for m in resp.get("messages", []))
+        ids = [m["id"] for m in resp.get("messages", [])]
         page_token = resp.get("nextPageToken")
+        if ids:
+            yield ids, page_token
         if not page_token:
             break
+
+
+def list_all_message_ids(service) -> List[str]:
+    ids: List[str] = []
+    for page, _ in iter_message_id_pages(service):
+        ids.extend(page)
     return ids
 
 
+def rechunk(pages: Iterable[List], chunk_size: int) -> Iterator[List]:
+    # 크기가 제각각인 리스트 스트림을 chunk_size 단위로 다시 묶음
+    buf: List = []
+    for page in pages:
+        buf.extend(page)
+        while len(buf) >= chunk_size:
+            yield buf[:chunk_size]
+            buf = buf[chunk_size:]
+    if buf:
+        yield buf
+
+
 def _parse_message(resp: dict) -> dict:
     headers = resp.get("payload", {}).get("headers", [])
     header_map = {h["name"]: h["value"] for h in headers}
@@ -152,96 +255,188 @@ def _parse_message(resp: dict) -> dict:
     }
 
 
-def _execute_with_backoff(fn, max_retries: int = 5):
+def _is_rate_limited(e: HttpError) -> bool:
+    status = getattr(e.resp, "status", None)
+    return status == 429 or "rateLimitExceeded" in str(e)
+
+
+def _execute_with_backoff(
+    fn, max_retries: int = 5, limiter: Optional[AdaptiveTokenBucket] = None
+):
+    # 고정 sleep/지수 백오프 대신 토큰 버킷이 호출 간격을 조절
+    limiter = limiter or AdaptiveTokenBucket()
     for attempt in range(max_retries):
+        limiter.acquire()
         try:
-            return fn()
+            result = fn()
         except HttpError as e:
-            status = getattr(e.resp, "status", None)
-            if status == 429 or "rateLimitExceeded" in str(e):
-                sleep_sec = (2**attempt) + random.uniform(0, 1)
+            if _is_rate_limited(e):
+                limiter.on_throttle()
                 logger.warning(
-                    f"rateLimitExceeded (status={status}), retry {attempt + 1}/{max_retries} "
-                    f"after {sleep_sec:.2f}s"
+                    f"rateLimitExceeded (status={getattr(e.resp, 'status', None)}), "
+                    f"retry {attempt + 1}/{max_retries} at {limiter.rate:.1f} req/s"
                 )
-                time.sleep(sleep_sec)
-            else:
-                raise
+                continue
+            raise
+        limiter.on_success()
+        return result
     raise RuntimeError(f"Max retries ({max_retries}) reached")
 
 
-def batch_fetch_metadata(
-    service, msg_ids: List[str], batch_size: int = 20, max_retries: int = 5
-) -> List[dict]:
+def _metadata_request(service, mid: str):
+    return (
+        service.users()
+        .messages()
+        .get(
+            userId="me",
+            id=mid,
+            format="metadata",
+            metadataHeaders=["Subject", "From", "Date"],
+        )
+    )
+
+
+def _authorized_http(creds):
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+
+    # httplib2.Http는 스레드 간 공유가 안전하지 않으므로 스레드마다 따로 생성
+    return AuthorizedHttp(creds, http=httplib2.Http())
+
+
+def _is_retryable(err) -> bool:
+    # 429 / rateLimitExceeded / 5xx 는 재시도, 그 외(404 등)는 포기
+    if not isinstance(err, HttpError):
+        return True
+    status = getattr(err.resp, "status", None)
+    return _is_rate_limited(err) or (status is not None and status >= 500)
+
+
+def _run_metadata_batch(
+    service,
+    ids: List[str],
+    limiter: AdaptiveTokenBucket,
+    http=None,
+) -> Tuple[List[dict], List[str]]:
+    # 배치 한 번 실행 → (성공한 메일, 재시도할 id) 반환
     mails: List[dict] = []
+    retry_ids: List[str] = []
+    throttled = False
 
     def _collect(request_id, resp, err):
+        nonlocal throttled
         if err:
-            logger.warning(f"Batch fetch error for {request_id}: {err}")
+            if _is_retryable(err):
+                retry_ids.append(request_id)
+                throttled = throttled or _is_rate_limited(err)
+            else:
+                logger.warning(f"Batch fetch error for {request_id}: {err}")
             return
         mails.append(_parse_message(resp))
 
-    def _run_batch(batch_req):
-        return _execute_with_backoff(batch_req.execute, max_retries)
-
     batch = service.new_batch_http_request(callback=_collect)
+    for mid in ids:
+        batch.add(_metadata_request(service, mid), request_id=mid)
+
+    # 배치 안의 요청 수만큼 토큰 소비
+    limiter.acquire(len(ids))
+    try:
+        batch.execute(http=http)
+    except HttpError as e:
+        # 배치 자체가 실패하면 전체를 재시도 큐로
+        if _is_rate_limited(e):
+            limiter.on_throttle()
+        logger.warning(f"[batch_fetch_metadata] 배치 실행 실패: {e}")
+        return [], list(ids)
+
+    if throttled:
+        limiter.on_throttle()
+    else:
+        limiter.on_success()
+    return mails, retry_ids
+
+
+def _next_batch_size(size: int, error_rate: float) -> int:
+    # 실패율이 높으면 절반으로, 안정적이면 조금씩 키움 (Gmail 배치 상한 100)
+    if error_rate > 0.1:
+        return max(MIN_BATCH_SIZE, size // 2)
+    if error_rate == 0:
+        return min(MAX_BATCH_SIZE, size + 10)
+    return size
 
-    for idx, mid in enumerate(msg_ids, start=1):
-        req = (
-            service.users()
-            .messages()
-            .get(
-                userId="me",
-                id=mid,
-                format="metadata",
-                metadataHeaders=["Subject", "From", "Date"],
-            )
-        )
-        batch.add(req, request_id=mid)
 
-        if idx % batch_size == 0:
-            try:  # 배치 실패 시에도 로그만 남기고 계속 진행
-                _run_batch(batch)
-            except HttpError as e:
-                logger.error(f"[batch_fetch_metadata] 배치 실행 실패: {e}")
-            finally:
-                batch = service.new_batch_http_request(callback=_collect)
-            time.sleep(0.2)
+def batch_fetch_metadata(
+    service,
+    msg_ids: List[str],
+    batch_size: Optional[int] = None,
+    max_retries: int = 5,
+    limiter: Optional[AdaptiveTokenBucket] = None,
+    creds=None,
+    max_workers: Optional[int] = None,
+) -> List[dict]:
+    limiter = limiter or AdaptiveTokenBucket(
+        rate=Config.GMAIL_RATE_INITIAL, max_rate=Config.GMAIL_RATE_MAX
+    )
+    # creds가 있어야 스레드별 http를 만들 수 있음 → 없으면 순차 실행
+    if creds is None:
+        max_workers = 1
+    else:
+        max_workers = max_workers or Config.GMAIL_FETCH_WORKERS
 
-    remainder = len(msg_ids) % batch_size
-    if remainder:
-        try:
-            _run_batch(batch)
-        except HttpError as e:
-            logger.error(f"[batch_fetch_metadata] 나머지 배치 실행 실패: {e}")
-        finally:
-            batch = None  # 더 이상 batch를 쓰지 않으므로 None으로 해제
-        time.sleep(0.2)
+    local = threading.local()
 
-    fetched_ids = {m["id"] for m in mails}
-    missing = [mid for mid in msg_ids if mid not in fetched_ids]
+    def _thread_http():
+        if creds is None:
+            return None
+        if not hasattr(local, "http"):
+            local.http = _authorized_http(creds)
+        return local.http
+
+    def _job(ids: List[str]) -> Tuple[List[dict], List[str]]:
+        return _run_metadata_batch(service, ids, limiter, _thread_http())
+
+    mails: List[dict] = []
+    queue = list(msg_ids)
+    # 배치 크기는 limiter에 저장해서 같은 limiter를 쓰는 다음 청크가 이어받음
+    size = min(batch_size or limiter.batch_size, MAX_BATCH_SIZE)
+
+    # 실패한 하위 요청만 모아 다시 배치로 재시도 (라운드마다 백오프)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for attempt in range(max_retries):
+            if not queue:
+                break
+            if attempt:
+                sleep_sec = min(2**attempt, 16) * random.uniform(0.5, 1)
+                logger.warning(
+                    f"[batch_fetch_metadata] {len(queue)}개 재시도 "
+                    f"{attempt}/{max_retries - 1}, batch_size={size}, "
+                    f"after {sleep_sec:.2f}s"
+                )
+                time.sleep(sleep_sec)
+
+            batches = [queue[i : i + size] for i in range(0, len(queue), size)]
+            retry: List[str] = []
+            for fetched, failed in pool.map(_job, batches):
+                mails.extend(fetched)
+                retry.extend(failed)
+
+            # 첫 라운드 포함 매 라운드 결과로 조정
+            size = _next_batch_size(size, len(retry) / len(queue))
+            limiter.batch_size = size
+            queue = retry
+
+    # 배치 재시도로도 계속 실패한 id만 단건 조회
+    missing = queue
     if missing:
         logger.warning(
-            f"Fetched {len(fetched_ids)} items, expected {len(msg_ids)}. "
+            f"Fetched {len(mails)} items, expected {len(msg_ids)}. "
             f"Retrying {len(missing)} missing IDs individually."
         )
         for mid in missing:
-
-            def _get_single():
-                return (
-                    service.users()
-                    .messages()
-                    .get(
-                        userId="me",
-                        id=mid,
-                        format="metadata",
-                        metadataHeaders=["Subject", "From", "Date"],
-                    )
-                    .execute()
-                )
-
             try:
-                resp = _execute_with_backoff(_get_single, max_retries)
+                resp = _execute_with_backoff(
+                    _metadata_request(service, mid).execute, max_retries, limiter
+                )
                 mails.append(_parse_message(resp))
             except HttpError as e:
                 status = getattr(e.resp, "status", None)
@@ -268,6 +463,56 @@ def batch_fetch_metadata(
     return mails
 
 
-def initial_load(service) -> List[dict]:
-    ids = list_all_message_ids(service)
-    return batch_fetch_metadata(service, ids)
+class MailChunk(NamedTuple):
+    mails: List[dict]
+    id_count: int  # 이 청크에서 처리한 id 수 (404 등으로 mails보다 많을 수 있음)
+    page_token: Optional[str]  # 이 청크 다음부터 조회할 페이지 토큰
+    ids: Tuple[str, ...] = ()  # messages.list로 받은 id (초기 적재만)
+
+
+def _id_key(mid: str):
+    # Gmail 메시지 id는 16자리 hex → int로 저장하면 문자열보다 훨씬 작음
+    try:
+        return int(mid, 16)
+    except ValueError:
+        return mid
+
+
+def load_known_message_ids(db: Session, user_id: str) -> Set:
+    # (user_id, gmail_msg_id) 유니크 인덱스만 읽는 쿼리 한 번으로 적재
+    rows = db.execute(
+        select(MailEmbedding.gmail_msg_id)
+        .where(MailEmbedding.user_id == user_id)
+        .execution_options(yield_per=10000)
+    ).scalars()
+    return {_id_key(mid) for mid in rows}
+
+
+def drop_known_ids(ids: List[str], known_ids: Optional[Set]) -> List[str]:
+    if not known_ids:
+        return ids
+    return [mid for mid in ids if _id_key(mid) not in known_ids]
+
+
+def initial_load(
+    service,
+    chunk_size: int = 500,
+    creds=None,
+    page_token: Optional[str] = None,
+    known_ids: Optional[Set] = None,
+) -> Iterator[MailChunk]:
+    # 청크 간에 같은 limiter를 공유해서 학습된 호출 속도를 유지
+    limiter = AdaptiveTokenBucket(
+        rate=Config.GMAIL_RATE_INITIAL, max_rate=Config.GMAIL_RATE_MAX
+    )
+    # 한 페이지 = 한 청크로 맞춰야 page_token을 체크포인트로 쓸 수 있음
+    page_size = min(chunk_size, 500)
+    for ids, next_token in iter_message_id_pages(service, page_size, page_token):
+        # 이미 적재된 메시지는 Gmail 배치 호출/임베딩 전에 제외
+        new_ids = drop_known_ids(ids, known_ids)
+        mails = (
+            batch_fetch_metadata(service, new_ids, limiter=limiter, creds=creds)
+            if new_ids
+            else []
+        )
+        yield MailChunk(mails, len(ids), next_token, tuple(ids))
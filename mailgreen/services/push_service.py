@@ -0,0 +1,88 @@
+import base64
+import json
+import logging
+import sys
+from typing import Tuple
+
+from sqlalchemy.orm import Session
+
+from mailgreen.app.config import Config
+from mailgreen.app.models import User
+from mailgreen.app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def pending_key(user_id: str) -> str:
+    return f"push:pending:{user_id}"
+
+
+def parse_notification(payload: dict) -> Tuple[str, str]:
+    # Pub/Sub 봉투({"message": {"data": base64}}) 또는 평문 {"emailAddress", "historyId"}
+    # 잘못된 base64 / JSON도 ValueError 하위 예외 → 호출하는 쪽에서 400
+    message = payload.get("message")
+    if isinstance(message, dict) and message.get("data"):
+        data = json.loads(base64.b64decode(message["data"]))
+    else:
+        data = payload
+    if not isinstance(data, dict):
+        raise ValueError("알림 데이터가 객체가 아님")
+
+    email = data.get("emailAddress")
+    history_id = data.get("historyId")
+    if not email or history_id is None:
+        raise ValueError("emailAddress / historyId 누락")
+    # 이후 int()로 비교하므로 숫자가 아니면 여기서 거부
+    history_id = str(history_id)
+    if not (history_id.isascii() and history_id.isdigit()):
+        raise ValueError("historyId가 숫자가 아님")
+    return email, history_id
+
+
+def handle_push_notification(db: Session, email: str, history_id: str) -> dict:
+    from mailgreen.tasks.push_sync import sync_from_push
+
+    user = db.query(User).filter(User.email == email).first()
+    if not user:
+        logger.info("[push] 등록되지 않은 주소의 알림 무시")
+        return {"accepted": False, "reason": "unknown user"}
+
+    user_id = str(user.id)
+    r = get_redis()
+    key = pending_key(user_id)
+    debounce = Config.PUSH_DEBOUNCE_SEC
+
+    # 디바운스 구간의 첫 알림만 동기화 작업을 예약, 나머지는 historyId만 갱신
+    first = r.set(key, history_id, nx=True, ex=debounce * 10)
+    if first:
+        sync_from_push.apply_async(args=[user_id], countdown=debounce)
+    else:
+        current = r.get(key)
+        if current is None or int(history_id) > int(current):
+            r.set(key, history_id, xx=True, keepttl=True)
+
+    return {"accepted": True, "coalesced": not first}
+
+
+def publish_local_notification(
+    email: str, history_id: str, url: str = "http://localhost:8000/push/gmail"
+) -> dict:
+    # 로컬 테스트용 Pub/Sub 대체 발행기
+    import httpx
+
+    data = json.dumps({"emailAddress": email, "historyId": history_id})
+    envelope = {
+        "message": {"data": base64.b64encode(data.encode()).decode()},
+        "subscription": "local",
+    }
+    params = {}
+    if Config.PUSH_VERIFICATION_TOKEN:
+        params["token"] = Config.PUSH_VERIFICATION_TOKEN
+    resp = httpx.post(url, json=envelope, params=params, timeout=10)
+    resp.raise_for_status()
+    return resp.json()
+
+
+if __name__ == "__main__":
+    # python -m mailgreen.services.push_service <email> <historyId> [url]
+    print(publish_local_notification(*sys.argv[1:]))
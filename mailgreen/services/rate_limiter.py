@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class AdaptiveTokenBucket:
+    """
+    Gmail API 호출량 제어용 토큰 버킷.
+    성공하면 초당 허용량을 조금씩 올리고(additive increase),
+    429 / rateLimitExceeded를 만나면 절반으로 줄임(multiplicative decrease).
+    여러 스레드에서 공유해도 안전함.
+    batch_size는 이 버킷을 공유하는 배치 호출이 학습한 배치 크기 (청크 간 유지).
+    """
+
+    def __init__(
+        self,
+        rate: float = 20.0,
+        min_rate: float = 2.0,
+        max_rate: float = 50.0,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        batch_size: int = 20,
+    ):
+        self.rate = rate
+        self.batch_size = batch_size
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._tokens = rate
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_rate, self._tokens + (now - self._last) * self.rate
+        )
+        self._last = now
+
+    def acquire(self, n: int = 1) -> None:
+        # 버킷 용량보다 큰 요청은 용량만큼만 요구 (무한 대기 방지)
+        n = min(n, self.max_rate)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                wait = (n - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # 남은 토큰을 비워서 모든 스레드가 잠시 쉬도록 함
+            self._tokens = min(self._tokens, 0.0)
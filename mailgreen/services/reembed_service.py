@@ -0,0 +1,189 @@
+import logging
+import sys
+from collections import Counter
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import and_, exists, text
+from sqlalchemy.orm import Session
+
+from mailgreen.app.models import MajorTopic, MajorTopicEmbedding
+from mailgreen.services.assign_topic_service import (
+    _normalize_rows,
+    assign_categories,
+    load_topic_matrices,
+)
+from mailgreen.services.bulk_load_service import _pg_vector
+from mailgreen.services.embed_backend import model_id
+from mailgreen.services.embed_service import get_embedding, prepare_text
+
+logger = logging.getLogger(__name__)
+
+# 모델을 바꾸면 기존 행은 이전 모델 벡터를 그대로 쓰다가
+# 백필이 지나간 행부터 새 모델 벡터로 바뀜 (embed_model 컬럼으로 구분)
+#
+# 기존 대주제 벡터는 직접 정리해서 넣은 값이라 새 모델의 이름 + 설명 벡터와
+# 만드는 방식이 다름 → 모델과 무관하게 분류가 달라질 수 있으므로 전환 전에
+# compare_topic_assignments로 확인하고, 필요하면 새 모델의 대주제 벡터를
+# 미리 넣어둠 (ensure_topic_embeddings는 없는 것만 만듦)
+
+
+def _topic_texts(topics: List[MajorTopic]) -> List[str]:
+    return [prepare_text(t.name, t.description or "") for t in topics]
+
+
+def ensure_topic_embeddings(db: Session, embed_model: str) -> int:
+    """embed_model로 만든 대주제 벡터가 없으면 이름 + 설명으로 생성."""
+    missing = (
+        db.query(MajorTopic)
+        .filter(
+            ~exists().where(
+                and_(
+                    MajorTopicEmbedding.topic_id == MajorTopic.id,
+                    MajorTopicEmbedding.embed_model == embed_model,
+                )
+            )
+        )
+        .all()
+    )
+    if not missing:
+        return 0
+
+    vectors = get_embedding(_topic_texts(missing))
+    for topic, vec in zip(missing, vectors):
+        db.add(
+            MajorTopicEmbedding(topic_id=topic.id, embed_model=embed_model, vector=vec)
+        )
+    logger.info(f"[reembed] {embed_model} 대주제 벡터 {len(missing)}개 생성")
+    return len(missing)
+
+
+def count_stale(db: Session, embed_model: str) -> int:
+    return db.execute(
+        text(
+            """
+            SELECT count(*) FROM mail_embeddings
+            WHERE embed_model IS DISTINCT FROM :model
+            """
+        ),
+        {"model": embed_model},
+    ).scalar()
+
+
+def reembed_chunk(
+    db: Session, embed_model: str, after_id: Optional[str], limit: int
+) -> Optional[str]:
+    """
+    id 순서로 after_id 다음부터 limit개를 embed_model로 다시 임베딩.
+    마지막으로 처리한 id를 반환 (남은 행이 없으면 None). 커밋은 호출하는 쪽에서.
+    """
+    rows = db.execute(
+        text(
+            """
+            SELECT id, subject, snippet FROM mail_embeddings
+            WHERE embed_model IS DISTINCT FROM :model
+              AND (CAST(:after AS uuid) IS NULL OR id > CAST(:after AS uuid))
+            ORDER BY id
+            LIMIT :n
+            """
+        ),
+        {"model": embed_model, "after": after_id, "n": limit},
+    ).all()
+    if not rows:
+        return None
+
+    vectors = get_embedding([prepare_text(r.subject, r.snippet) for r in rows])
+    # 그 사이 run_analysis가 새 모델로 갱신한 행은 덮어쓰지 않음
+    # 새 벡터로 다시 분류되도록 분류 시각을 비움
+    db.execute(
+        text(
+            """
+            UPDATE mail_embeddings AS m
+            SET vector = CAST(v.vec AS halfvec), embed_model = :model,
+                classified_at = NULL
+            FROM unnest(CAST(:ids AS uuid[]), CAST(:vecs AS text[])) AS v(id, vec)
+            WHERE m.id = v.id AND m.embed_model IS DISTINCT FROM :model
+            """
+        ),
+        {
+            "model": embed_model,
+            "ids": [str(r.id) for r in rows],
+            "vecs": [_pg_vector(v) for v in vectors],
+        },
+    )
+    return str(rows[-1].id)
+
+
+class _SampleRow(NamedTuple):
+    vector: object
+    labels: Optional[List[str]]
+    embed_model: str
+
+
+def compare_topic_assignments(
+    db: Session, old_model: str, sample_size: int = 1000
+) -> dict:
+    """
+    모델 전환 전 확인용. old_model 벡터 표본을 기존 대주제 벡터로 분류한 결과와
+    현재 모델로 다시 임베딩해 현재 모델 대주제 벡터로 분류한 결과를 비교.
+    현재 모델 대주제 벡터가 아직 없으면 ensure_topic_embeddings와 같은 방식
+    (이름 + 설명)으로 만들어 비교만 하고 저장하지 않음.
+    """
+    new_model = model_id()
+    rows = db.execute(
+        text(
+            """
+            SELECT subject, snippet, labels, vector FROM mail_embeddings
+            WHERE embed_model = :model AND NOT is_deleted AND vector IS NOT NULL
+            ORDER BY random() LIMIT :n
+            """
+        ),
+        {"model": old_model, "n": sample_size},
+    ).all()
+    if not rows:
+        raise ValueError(f"{old_model} 벡터를 가진 메일이 없습니다.")
+
+    topics = load_topic_matrices(db)
+    if old_model not in topics:
+        raise ValueError(f"{old_model} 대주제 벡터가 없습니다.")
+    if new_model not in topics:
+        all_topics = db.query(MajorTopic).order_by(MajorTopic.id).all()
+        vectors = np.asarray(get_embedding(_topic_texts(all_topics)), np.float32)
+        topics[new_model] = (
+            np.array([t.id for t in all_topics]),
+            _normalize_rows(vectors),
+        )
+
+    new_vectors = get_embedding([prepare_text(r.subject, r.snippet) for r in rows])
+    before = assign_categories(
+        [_SampleRow(r.vector, r.labels, old_model) for r in rows], topics
+    )
+    after = assign_categories(
+        [_SampleRow(v, r.labels, new_model) for r, v in zip(rows, new_vectors)],
+        topics,
+    )
+
+    changes = Counter(
+        f"{b.category}->{a.category}"
+        for b, a in zip(before, after)
+        if b.category != a.category
+    )
+    return {
+        "old_model": old_model,
+        "new_model": new_model,
+        "samples": len(rows),
+        "agreement": 1 - sum(changes.values()) / len(rows),
+        "changes": dict(changes.most_common()),
+    }
+
+
+if __name__ == "__main__":
+    # EMBED_MODEL_NAME을 새 모델로 두고 실행
+    # python -m mailgreen.services.reembed_service <old_model> [sample_size]
+    from mailgreen.app.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(compare_topic_assignments(session, sys.argv[1], *map(int, sys.argv[2:3])))
+    finally:
+        session.close()
@@ -0,0 +1,73 @@
+import logging
+import sys
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from mailgreen.app.config import Config
+from mailgreen.app.database import SessionLocal
+from mailgreen.services.assign_topic_service import (
+    classify_pending,
+    classify_pending_in_db,
+    reclassify_changed_topics,
+)
+from mailgreen.tasks.mail_analysis import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+def _classify(
+    db: Session,
+    user_id: Optional[str] = None,
+    gmail_msg_ids: Optional[List[str]] = None,
+) -> int:
+    # 두 방식 모두 청크마다 커밋
+    if Config.CLASSIFY_MODE == "db":
+        return classify_pending_in_db(db, user_id, gmail_msg_ids)
+    return classify_pending(db, user_id, gmail_msg_ids)
+
+
+@celery_app.task
+def classify_mails(
+    user_id: Optional[str] = None, gmail_msg_ids: Optional[List[str]] = None
+):
+    """
+    run_analysis가 끝난 뒤 해당 사용자(또는 방금 넣은 메일)만 분류.
+    user_id 없이 실행하면 전체 사용자의 분류 대기 메일을 분류.
+    """
+    db: Session = SessionLocal()
+    try:
+        count = _classify(db, user_id, gmail_msg_ids)
+        logger.info(
+            f"[classify_mails] user={user_id} mode={Config.CLASSIFY_MODE} {count}개 분류"
+        )
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+@celery_app.task
+def reclassify_topics():
+    """
+    대주제 벡터가 바뀌었으면 결과가 뒤집힐 수 있는 메일만 분류 대기로 되돌리고
+    전체 분류 대기 메일을 다시 분류 (주기 실행).
+    """
+    db: Session = SessionLocal()
+    try:
+        reset = reclassify_changed_topics(db)
+        db.commit()
+        count = _classify(db)
+        if reset or count:
+            logger.info(f"[reclassify_topics] {reset}개 되돌림, {count}개 분류")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # python -m mailgreen.tasks.classify [user_id]
+    print(classify_mails.delay(*sys.argv[1:2]).id)
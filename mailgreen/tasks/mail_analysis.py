@@ -1,34 +1,183 @@
-from mailgreen.services.assign_topic_service import batch_assign_category
 from mailgreen.services.auth_service import get_credentials
 
+import numpy as np
 from celery import Celery
+from kombu import Queue
+from celery.signals import worker_init, worker_process_shutdown
 from sqlalchemy.orm import Session
+from mailgreen.app.config import Config
 from mailgreen.app.database import SessionLocal
-from mailgreen.app.models import MailEmbedding, AnalysisTask
+from mailgreen.app.models import AnalysisTask
 from mailgreen.services.mail_service import (
     batch_fetch_metadata,
     initial_load,
+    rechunk,
+    MailChunk,
+    drop_known_ids,
+    load_known_message_ids,
     logger,
 )
+from mailgreen.services.bulk_load_service import upsert_mail_embeddings
+from mailgreen.services.rate_limiter import AdaptiveTokenBucket
+from mailgreen.services.reembed_service import ensure_topic_embeddings
+from mailgreen.services.history_sync_service import (
+    collect_history_delta,
+    apply_history_delta,
+    apply_label_updates,
+    delete_unlisted,
+    mark_listed,
+)
 from googleapiclient.discovery import build
-from mailgreen.services.embed_service import get_embedding
+from googleapiclient.errors import HttpError
+from mailgreen.services.embed_backend import model_id
+from mailgreen.services.embed_cache import flush_cache_stats, get_cache_stats
+from mailgreen.services.embed_pool import stop_pool
+from mailgreen.services.embed_service import (
+    get_embedding,
+    prepare_text,
+    preload_model,
+)
 from datetime import datetime, timezone
-from typing import Optional, List
+from typing import Optional, List, Iterator, Set, Tuple
 
 celery_app = Celery(
     "mail_analysis",
     broker="redis://localhost:6379/0",
     result_backend="redis://localhost:6379/1",
+    include=[
+        "mailgreen.tasks.scheduler",
+        "mailgreen.tasks.push_sync",
+        "mailgreen.tasks.reembed",
+        "mailgreen.tasks.classify",
+    ],
 )
+celery_app.conf.update(
+    # 초기 적재 / 증분 동기화 큐 분리, 워커는 한 번에 하나씩만 가져가도록
+    # 워커는 -Q 없이 실행하면 세 큐를 모두 소비 (README 참고)
+    task_queues=(
+        Queue("analysis.initial"),
+        Queue("analysis.incremental"),
+        Queue("embedding.backfill"),
+    ),
+    task_default_queue="analysis.incremental",
+    worker_prefetch_multiplier=1,
+    # 재임베딩 백필은 별도 큐 (분석 워커와 처리량을 따로 조절)
+    task_routes={
+        "mailgreen.tasks.reembed.reembed_mails": {"queue": "embedding.backfill"},
+    },
+    beat_schedule={
+        "dispatch-pending-analysis": {
+            "task": "mailgreen.tasks.scheduler.dispatch_pending",
+            "schedule": 30.0,
+        },
+        "reclassify-changed-topics": {
+            "task": "mailgreen.tasks.classify.reclassify_topics",
+            "schedule": 600.0,
+        },
+    },
+)
+
+
+@worker_init.connect
+def _preload_embedding_model(**kwargs):
+    # prefork 풀이 자식을 만들기 전에 부모에서 한 번만 로드
+    # 임베딩 서버를 쓰면 워커에는 모델을 올리지 않음
+    if Config.EMBED_PRELOAD_IN_WORKER and not Config.EMBED_SERVER_URL:
+        preload_model()
+        logger.info("[worker_init] 임베딩 모델 preload 완료")
+
+
+@worker_process_shutdown.connect
+def _stop_embedding_pool(**kwargs):
+    # 자식 프로세스가 띄운 멀티프로세스 임베딩 풀 정리, 남은 캐시 통계 전송
+    stop_pool()
+    flush_cache_stats()
+
+
+def _embed_stage(
+    mail_chunks: Iterator[MailChunk],
+) -> Iterator[Tuple[MailChunk, np.ndarray]]:
+    # 청크 단위로 임베딩 → 다음 단계로 (청크, 벡터) 쌍을 넘김
+    for chunk in mail_chunks:
+        texts = [prepare_text(m["subject"], m["snippet"]) for m in chunk.mails]
+        yield chunk, get_embedding(texts)
+
+
+def _resync_stage(
+    db: Session,
+    user_id: str,
+    mail_chunks: Iterator[MailChunk],
+    known_ids: Set,
+    chunk_size: int,
+) -> Iterator[MailChunk]:
+    # 전체 재적재: 이미 있는 메일은 라벨/읽음/삭제 상태만 갱신하고 새 메일만
+    # 임베딩 단계로 넘김 (갱신은 청크 체크포인트와 같은 트랜잭션으로 커밋됨)
+    for chunk in mail_chunks:
+        mark_listed(db, user_id, chunk.ids, datetime.now(timezone.utc))
+        new_ids = set(drop_known_ids([m["id"] for m in chunk.mails], known_ids))
+        known = {m["id"]: m["labels"] for m in chunk.mails if m["id"] not in new_ids}
+        apply_label_updates(db, user_id, known, chunk_size)
+        yield chunk._replace(mails=[m for m in chunk.mails if m["id"] in new_ids])
+
+
+def _build_records(user_id: str, mails: List[dict], vectors: np.ndarray) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    embed_model = model_id()
+    return [
+        {
+            "user_id": user_id,
+            "gmail_msg_id": mail["id"],
+            "sender": mail["from"],
+            "subject": mail["subject"],
+            "snippet": mail["snippet"],
+            "size_bytes": mail["size"],
+            "is_read": mail["isRead"],
+            "is_starred": mail["isStarred"],
+            "labels": mail["labels"],
+            "received_at": datetime.fromisoformat(mail["timestamp"]),
+            "vector": vec,
+            "embed_model": embed_model,
+            "processed_at": now,
+        }
+        for mail, vec in zip(mails, vectors)
+    ]
 
 
-@celery_app.task(bind=True)
+@celery_app.task(
+    bind=True,
+    max_retries=3,
+    # 워커가 죽으면 메시지를 다시 큐에 넣어 체크포인트부터 재개
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
 def run_analysis(
-    self, user_id: str, task_id: str, start_history_id: Optional[str] = None
+    self,
+    user_id: str,
+    task_id: str,
+    start_history_id: Optional[str] = None,
+    slice_no: int = 0,
 ):
+    from mailgreen.services.analysis_lock_service import (
+        refresh_analysis_lock,
+        release_analysis_lock,
+    )
+    from mailgreen.services.mail_service import start_analysis_task
+    from mailgreen.tasks.classify import classify_mails
+    from mailgreen.tasks.scheduler import enqueue_analysis, release
+
     db: Session = SessionLocal()
     task: AnalysisTask = db.query(AnalysisTask).get(task_id)
     orig_history = None
+    chunk_size = Config.ANALYSIS_CHUNK_SIZE
+    # 초기 적재는 일정 청크마다 끊고 스케줄러 대기열 맨 뒤로 다시 넣어
+    # 다른 사용자의 작업과 번갈아 실행되도록 함
+    max_chunks = None
+    continued = False
+    retrying = False
+    completed = False
+    delta = None
+    # 스케줄러 lease는 이 작업이 들어온 큐(job_kind) 기준으로 반납
+    queued_history_id = start_history_id
 
     try:
         if not task:
@@ -38,110 +187,200 @@ def run_analysis(
         creds = get_credentials(user_id)
         service = build("gmail", "v1", credentials=creds)
 
-        if start_history_id is None:
-            mails = initial_load(service)
-        else:
+        # 파이프라인: id 목록 → 메타데이터 → 임베딩 → DB insert
+        # 각 단계는 chunk_size 단위 제너레이터라 메모리 사용량이 메일 수와 무관함
+        # 재시작된 Task는 page_token / processed_count 체크포인트부터 이어서 처리
+        known_ids = load_known_message_ids(db, user_id)
+
+        if start_history_id is not None and task.history_id is None:
+            # 이전 실행에서 이미 전체 적재로 전환됨 (재시도/재전달)
+            # → 체크포인트를 지우지 않고 page_token부터 이어감
+            start_history_id = None
+
+        if start_history_id is not None:
             history_id = start_history_id or task.history_id
-            resp = (
-                service.users()
-                .history()
-                .list(
-                    userId="me",
-                    startHistoryId=history_id,
-                    historyTypes=["messageAdded"],
+            try:
+                delta = collect_history_delta(service, history_id)
+            except HttpError as e:
+                if getattr(e.resp, "status", None) != 404:
+                    raise
+                # startHistoryId 만료 → 전체 재적재 (upsert라 중복 안전)
+                # 체크포인트는 전환할 때 한 번만 초기화하고, history_id를 비워
+                # 이 Task를 초기 적재로 고정 (이후 조각/재시도는 page_token부터)
+                # 그동안 놓친 라벨 변경/삭제도 반영하도록 재적재 시작 시각을 남김
+                logger.warning(
+                    f"[run_analysis] historyId {history_id} 만료, 전체 적재로 전환"
                 )
-                .execute()
-            )
-            ids = [
-                m["message"]["id"]
-                for h in resp.get("history", [])
-                for m in h.get("messagesAdded", [])
-            ]
-            mails = batch_fetch_metadata(service, ids) if ids else []
+                start_history_id = None
+                orig_history = None
+                task.history_id = None
+                task.page_token = None
+                task.processed_count = 0
+                task.last_chunk = 0
+                task.load_history_id = None
+                task.resync_started_at = datetime.now(timezone.utc)
+                db.commit()
 
-        total = len(mails) or 1
-        total_steps = 4
-        step = 1
-
-        self.update_state(
-            state="PROGRESS",
-            meta={
-                "step": "fetch_metadata",
-                "progress_pct": int(step / total_steps * 100),
-            },
-        )
-        step += 1
+        if delta is None:
+            max_chunks = Config.SCHED_INITIAL_SLICE_CHUNKS
+            profile = service.users().getProfile(userId="me").execute()
+            total = profile.get("messagesTotal") or 1
+            if task.load_history_id is None:
+                # 적재를 시작하기 전의 historyId를 저장 → 조각 사이에 도착한 메일은
+                # messages.list에서 빠져도 완료 후 증분 동기화가 가져감
+                task.load_history_id = profile.get("historyId")
+                db.commit()
+            if task.last_chunk > 0 and task.page_token is None:
+                # 마지막 페이지까지 커밋된 상태 → 남은 작업 없음
+                mail_chunks = iter(())
+            else:
+                # 재적재면 기존 메일 상태도 다시 맞춰야 하므로 id를 거르지 않음
+                resync = task.resync_started_at is not None
+                mail_chunks = initial_load(
+                    service,
+                    chunk_size,
+                    creds=creds,
+                    page_token=task.page_token,
+                    known_ids=None if resync else known_ids,
+                )
+                if resync:
+                    mail_chunks = _resync_stage(
+                        db, user_id, mail_chunks, known_ids, chunk_size
+                    )
+        else:
+            # 라벨/삭제 변경은 메타데이터 재조회 없이 바로 반영, 새 메시지만 조회
+            apply_history_delta(db, user_id, delta, chunk_size)
+            db.commit()
+            ids = delta.added_ids
+            total = len(ids) or 1
+            limiter = AdaptiveTokenBucket(
+                rate=Config.GMAIL_RATE_INITIAL, max_rate=Config.GMAIL_RATE_MAX
+            )
+            mail_chunks = (
+                MailChunk(
+                    batch_fetch_metadata(
+                        service,
+                        drop_known_ids(chunk, known_ids),
+                        limiter=limiter,
+                        creds=creds,
+                    ),
+                    len(chunk),
+                    None,
+                )
+                for chunk in rechunk([ids[task.processed_count :]], chunk_size)
+            )
 
-        # 배치 임베딩
-        texts = [f"{m['subject']} {m['snippet']}"[:1024] for m in mails]
-        vectors: List[List[float]] = get_embedding(texts)
+        task.status = "running"
+        db.commit()
 
-        self.update_state(
-            state="PROGRESS",
-            meta={"step": "embedding", "progress_pct": int(step / total_steps * 100)},
-        )
-        step += 1
-
-        # bulk_insert 준비
-        CHUNK_SIZE = 500  # 트랜잭션 오버헤드와 메모리 사용량 균형을 위해 조정 가능
-        records = []
-        for mail, vec in zip(mails, vectors):
-            records.append(
-                {
-                    "user_id": user_id,
-                    "gmail_msg_id": mail["id"],
-                    "sender": mail["from"],
-                    "subject": mail["subject"],
-                    "snippet": mail["snippet"],
-                    "size_bytes": mail["size"],
-                    "is_read": mail["isRead"],
-                    "is_starred": mail["isStarred"],
-                    "labels": mail["labels"],
-                    "received_at": datetime.fromisoformat(mail["timestamp"]),
-                    "vector": vec,
-                    "processed_at": datetime.now(timezone.utc),
-                }
-            )
-        for i in range(0, len(records), CHUNK_SIZE):
-            chunk = records[i : i + CHUNK_SIZE]
-            db.bulk_insert_mappings(MailEmbedding, chunk)
-            pct = int((step - 1 + (i + len(chunk)) / total) / total_steps * 100)
+        chunks_done = 0
+        for chunk, vectors in _embed_stage(mail_chunks):
+            # upsert와 체크포인트 갱신을 한 트랜잭션으로 커밋
+            # → 작업 도중에도 결과 조회 가능, 재실행/중복 id에도 실패하지 않음
+            if chunk.mails:
+                upsert_mail_embeddings(
+                    db, _build_records(user_id, chunk.mails, vectors)
+                )
+            task.page_token = chunk.page_token
+            task.processed_count += chunk.id_count
+            task.last_chunk += 1
+            # 분류 단계 몫을 남겨두기 위해 최대 99%
+            pct = min(99, int(task.processed_count / total * 100))
+            task.progress_pct = pct
+            db.commit()
             self.update_state(
                 state="PROGRESS",
-                meta={"step": "db_insert", "progress_pct": pct},
+                meta={
+                    "step": "ingest",
+                    "processed": task.processed_count,
+                    "progress_pct": pct,
+                },
             )
-        db.commit()
-        step += 1
+            refresh_analysis_lock(user_id, task_id)
+            chunks_done += 1
+            if max_chunks and chunks_done >= max_chunks and chunk.page_token:
+                continued = True
+                break
+
+        if continued:
+            # 체크포인트는 이미 커밋됨 → 다음 조각을 대기열에 넣고 종료
+            task.status = "pending"
+            db.commit()
+            enqueue_analysis(user_id, task_id, start_history_id, slice_no + 1)
+            # 대기열에서 기다리는 동안에도 lease 유지
+            refresh_analysis_lock(user_id, task_id)
+            return
 
         self.update_state(
             state="PROGRESS",
-            meta={"step": "classify", "progress_pct": 100},
+            meta={
+                "step": "classify",
+                "processed": task.processed_count,
+                "progress_pct": 100,
+            },
         )
 
         #  Task 완료 처리
-        new_history = service.users().getProfile(userId="me").execute().get("historyId")
+        new_history = (
+            (delta and delta.history_id)
+            or task.load_history_id
+            or service.users().getProfile(userId="me").execute().get("historyId")
+        )
+        if task.resync_started_at is not None:
+            # 재적재 동안 목록에 한 번도 나오지 않은 메일 = Gmail에서 삭제됨
+            delete_unlisted(db, user_id, task.resync_started_at)
+            task.resync_started_at = None
         task.history_id = new_history
+        task.load_history_id = None
+        task.page_token = None
         task.status = "done"
         task.progress_pct = 100
         task.finished_at = datetime.now(timezone.utc)
+        # 모델을 바꾼 직후라도 새 벡터를 분류할 수 있도록 대주제 벡터 준비
+        ensure_topic_embeddings(db, model_id())
         db.commit()
+        completed = True
+        flush_cache_stats()
+        logger.info(f"[run_analysis] embedding cache: {get_cache_stats()}")
 
-    #  Task 실패 처리
+    #  Task 실패 처리 (체크포인트는 유지)
     except Exception as e:
+        db.rollback()
+        logger.error(f"[run_analysis] 예외 발생: {e}", exc_info=True)
         if task:
             task.history_id = orig_history
-            task.progress_pct = 0
-            task.status = "failed"
             task.error_msg = str(e)
+            if self.request.retries < self.max_retries:
+                task.status = "retrying"
+                db.commit()
+                retrying = True
+                raise self.retry(exc=e, countdown=30 * 2**self.request.retries)
+            task.status = "failed"
             task.finished_at = datetime.now(timezone.utc)
             db.commit()
-        logger.error(f"[run_analysis] 예외 발생: {e}", exc_info=True)
     finally:
-        try:
-            batch_assign_category()
-        except Exception as e2:
-            logger.error(
-                f"[run_analysis] batch_assign_category 중 예외 발생: {e2}",
-                exc_info=True,
-            )
+        if not retrying:
+            # 재시도 중에는 같은 작업이 계속 자리를 차지
+            try:
+                release(user_id, self.request.id, queued_history_id)
+            except Exception as e3:
+                logger.error(f"[run_analysis] 스케줄러 반납 실패: {e3}", exc_info=True)
+        if not retrying and not continued:
+            # 실행 중 들어온 분석 요청이 있었으면 끝난 뒤 한 번 더 실행
+            try:
+                if release_analysis_lock(user_id, task_id):
+                    start_analysis_task(db, user_id)
+            except Exception as e4:
+                logger.error(f"[run_analysis] 재실행 처리 실패: {e4}", exc_info=True)
+        if completed:
+            # 분류는 별도 작업으로, 적재가 끝났을 때 한 번만 (증분이면 새로 추가된 메일만)
+            # 중간 조각/실패로 남은 분류 대기 메일은 주기 작업(reclassify_topics)이 처리
+            try:
+                added_ids = delta.added_ids if delta is not None else None
+                if added_ids is None or added_ids:
+                    classify_mails.delay(user_id, added_ids)
+            except Exception as e2:
+                logger.error(
+                    f"[run_analysis] classify_mails 예약 실패: {e2}", exc_info=True
+                )
         db.close()
@@ -0,0 +1,38 @@
+import logging
+
+from mailgreen.app.database import SessionLocal
+from mailgreen.app.models import AnalysisTask
+from mailgreen.app.redis_client import get_redis
+from mailgreen.services.push_service import pending_key
+from mailgreen.tasks.mail_analysis import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task
+def sync_from_push(user_id: str):
+    from mailgreen.services.mail_service import start_analysis_task
+
+    # 먼저 지워야 동기화 도중 들어온 알림이 다음 동기화를 예약할 수 있음
+    pushed_history = get_redis().getdel(pending_key(user_id))
+
+    db = SessionLocal()
+    try:
+        last = (
+            db.query(AnalysisTask)
+            .filter(
+                AnalysisTask.user_id == user_id, AnalysisTask.history_id.isnot(None)
+            )
+            .order_by(AnalysisTask.started_at.desc())
+            .first()
+        )
+        if not last:
+            # 초기 분석 전인 사용자는 push로 전체 적재를 시작하지 않음
+            logger.info(f"[sync_from_push] user={user_id} 초기 분석 전, 스킵")
+            return
+        if pushed_history and int(pushed_history) <= int(last.history_id):
+            return
+
+        start_analysis_task(db, user_id)
+    finally:
+        db.close()
@@ -0,0 +1,87 @@
+import logging
+import sys
+import time
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from mailgreen.app.config import Config
+from mailgreen.app.database import SessionLocal
+from mailgreen.services.embed_backend import model_id
+from mailgreen.services.reembed_service import (
+    count_stale,
+    ensure_topic_embeddings,
+    reembed_chunk,
+)
+from mailgreen.tasks.mail_analysis import celery_app
+
+logger = logging.getLogger(__name__)
+
+# 남은 행이 있어도 다시 처음부터 훑기 전에 기다리는 시간
+# (롤링 배포 중 이전 모델 워커가 아직 쓰고 있을 수 있음)
+_RESCAN_DELAY_SEC = 300
+
+
+@celery_app.task(
+    bind=True,
+    max_retries=5,
+    # 워커가 죽으면 같은 after_id부터 다시 실행
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def reembed_mails(
+    self, embed_model: Optional[str] = None, after_id: Optional[str] = None
+):
+    """
+    embed_model이 아닌 벡터를 id 순서로 청크씩 다시 임베딩.
+    한 번에 REEMBED_CHUNKS_PER_RUN 청크만 처리하고 다음 위치로 자신을 다시 예약해서
+    분석 작업과 워커를 나눠 쓰고, 중단돼도 마지막 커밋 위치부터 이어감.
+    """
+    current = model_id()
+    embed_model = embed_model or current
+    if embed_model != current:
+        # 이 워커가 로드한 모델과 다르면 벡터를 만들 수 없음
+        logger.warning(
+            f"[reembed] 대상 모델 {embed_model} != 워커 모델 {current}, 중단"
+        )
+        return
+
+    db: Session = SessionLocal()
+    try:
+        if after_id is None:
+            ensure_topic_embeddings(db, embed_model)
+            db.commit()
+
+        for _ in range(Config.REEMBED_CHUNKS_PER_RUN):
+            last_id = reembed_chunk(
+                db, embed_model, after_id, Config.REEMBED_CHUNK_SIZE
+            )
+            if last_id is None:
+                break
+            db.commit()
+            after_id = last_id
+            time.sleep(Config.REEMBED_THROTTLE_SEC)
+        else:
+            reembed_mails.apply_async(args=[embed_model, after_id])
+            return
+
+        remaining = count_stale(db, embed_model)
+        if remaining:
+            logger.info(f"[reembed] {remaining}개 남음, 처음부터 다시 확인")
+            reembed_mails.apply_async(
+                args=[embed_model, None], countdown=_RESCAN_DELAY_SEC
+            )
+        else:
+            logger.info(f"[reembed] {embed_model} 백필 완료")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[reembed] 예외 발생: {e}", exc_info=True)
+        raise self.retry(exc=e, countdown=60 * 2**self.request.retries)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # python -m mailgreen.tasks.reembed [embed_model]
+    target = sys.argv[1] if len(sys.argv) > 1 else None
+    print(reembed_mails.delay(target).id)
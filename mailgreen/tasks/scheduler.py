@@ -0,0 +1,199 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import redis
+
+from mailgreen.app.config import Config
+from mailgreen.app.redis_client import get_redis
+from mailgreen.services.analysis_lock_service import refresh_analysis_lock
+from mailgreen.tasks.mail_analysis import celery_app
+
+logger = logging.getLogger(__name__)
+
+# run_analysis 작업을 Celery 큐에 바로 넣지 않고 Redis에 사용자별로 쌓아둔 뒤
+# - 초기 적재 / 증분 동기화를 서로 다른 큐로 분리
+# - 사용자별 동시 실행 수 제한
+# - 사용자 간 라운드로빈
+# 순서로 꺼내서 실행함. 실행 중인 작업은 만료 시각이 있는 lease(ZSET)로 관리해서
+# 워커가 죽어도 일정 시간 후 자리가 풀림.
+# 대기 중(Redis 대기열 / Celery 큐)인 작업은 아직 사용자별 분석 lease를 연장하지
+# 못하므로 dispatch_pending이 대신 연장함.
+
+INITIAL = "initial"
+INCREMENTAL = "incremental"
+
+QUEUES = {
+    INITIAL: "analysis.initial",
+    INCREMENTAL: "analysis.incremental",
+}
+
+_MAX_INFLIGHT = {
+    INITIAL: Config.SCHED_MAX_INFLIGHT_INITIAL,
+    INCREMENTAL: Config.SCHED_MAX_INFLIGHT_INCREMENTAL,
+}
+
+
+def _jobs_key(kind: str, user_id: str) -> str:
+    return f"sched:{kind}:jobs:{user_id}"
+
+
+def _ring_key(kind: str) -> str:
+    return f"sched:{kind}:ring"
+
+
+def _ring_members_key(kind: str) -> str:
+    return f"sched:{kind}:ring_members"
+
+
+def _inflight_key(kind: str) -> str:
+    return f"sched:{kind}:inflight"
+
+
+def _user_active_key(user_id: str) -> str:
+    return f"sched:active:{user_id}"
+
+
+# celery_id → {"user_id", "task_id"} (Celery에 넘겼지만 아직 끝나지 않은 작업)
+_LEASE_OWNERS = "sched:lease_owners"
+
+
+def job_kind(start_history_id: Optional[str]) -> str:
+    return INITIAL if start_history_id is None else INCREMENTAL
+
+
+@contextmanager
+def _locked(r: redis.Redis):
+    # 링 갱신과 디스패치가 서로 끼어들지 않도록 전역 락
+    lock = r.lock("sched:lock", timeout=10, blocking_timeout=5)
+    if not lock.acquire():
+        raise RuntimeError("scheduler lock 획득 실패")
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def _live_count(r: redis.Redis, key: str, now: float) -> int:
+    # 만료된 lease 정리 후 남은 개수
+    r.zremrangebyscore(key, "-inf", now)
+    return r.zcard(key)
+
+
+def enqueue_analysis(
+    user_id: str,
+    task_id: str,
+    start_history_id: Optional[str] = None,
+    slice_no: int = 0,
+) -> str:
+    """작업을 사용자별 대기열에 넣고 디스패치를 시도. Celery task id 반환."""
+    kind = job_kind(start_history_id)
+    celery_id = task_id if slice_no == 0 else f"{task_id}-{slice_no}"
+    job = {
+        "user_id": user_id,
+        "task_id": task_id,
+        "start_history_id": start_history_id,
+        "slice_no": slice_no,
+        "celery_id": celery_id,
+    }
+    r = get_redis()
+    with _locked(r):
+        r.rpush(_jobs_key(kind, user_id), json.dumps(job))
+        if r.sadd(_ring_members_key(kind), user_id):
+            r.rpush(_ring_key(kind), user_id)
+    dispatch()
+    return celery_id
+
+
+def _start(r: redis.Redis, kind: str, job: dict, now: float) -> None:
+    from mailgreen.tasks.mail_analysis import run_analysis
+
+    expire_at = now + Config.SCHED_LEASE_SEC
+    r.zadd(_user_active_key(job["user_id"]), {job["celery_id"]: expire_at})
+    r.zadd(_inflight_key(kind), {job["celery_id"]: expire_at})
+    r.hset(
+        _LEASE_OWNERS,
+        job["celery_id"],
+        json.dumps({"user_id": job["user_id"], "task_id": job["task_id"]}),
+    )
+    run_analysis.apply_async(
+        args=[job["user_id"], job["task_id"], job["start_history_id"]],
+        kwargs={"slice_no": job["slice_no"]},
+        task_id=job["celery_id"],
+        queue=QUEUES[kind],
+    )
+
+
+def dispatch() -> int:
+    """자리가 남는 만큼 라운드로빈으로 대기 작업을 Celery에 넘김."""
+    r = get_redis()
+    started = 0
+    with _locked(r):
+        now = time.time()
+        # 짧은 증분 동기화를 먼저 채움
+        for kind in (INCREMENTAL, INITIAL):
+            ring = _ring_key(kind)
+            for _ in range(r.llen(ring)):
+                if _live_count(r, _inflight_key(kind), now) >= _MAX_INFLIGHT[kind]:
+                    break
+                user_id = r.lpop(ring)
+                if user_id is None:
+                    break
+                active = _live_count(r, _user_active_key(user_id), now)
+                if active < Config.SCHED_USER_CONCURRENCY:
+                    raw = r.lpop(_jobs_key(kind, user_id))
+                    if raw:
+                        _start(r, kind, json.loads(raw), now)
+                        started += 1
+                # 남은 작업이 있으면 링 맨 뒤로
+                if r.llen(_jobs_key(kind, user_id)):
+                    r.rpush(ring, user_id)
+                else:
+                    r.srem(_ring_members_key(kind), user_id)
+    return started
+
+
+def release(user_id: str, celery_id: str, start_history_id: Optional[str]) -> None:
+    """작업 종료 시 lease를 반납하고 다음 작업을 디스패치."""
+    r = get_redis()
+    r.zrem(_user_active_key(user_id), celery_id)
+    r.zrem(_inflight_key(job_kind(start_history_id)), celery_id)
+    r.hdel(_LEASE_OWNERS, celery_id)
+    dispatch()
+
+
+def refresh_waiting_locks() -> int:
+    """대기열 / Celery 큐에 있거나 실행 중인 작업의 사용자별 분석 lease를 연장."""
+    r = get_redis()
+    owners = set()
+    for kind in (INCREMENTAL, INITIAL):
+        for user_id in r.smembers(_ring_members_key(kind)):
+            for raw in r.lrange(_jobs_key(kind, user_id), 0, -1):
+                job = json.loads(raw)
+                owners.add((job["user_id"], job["task_id"]))
+
+    now = time.time()
+    live = set()
+    for kind in (INCREMENTAL, INITIAL):
+        live.update(r.zrangebyscore(_inflight_key(kind), now, "+inf"))
+    for celery_id, raw in r.hgetall(_LEASE_OWNERS).items():
+        if celery_id in live:
+            owner = json.loads(raw)
+            owners.add((owner["user_id"], owner["task_id"]))
+        else:
+            # 만료된 lease → 워커가 죽은 작업이므로 더 연장하지 않음
+            r.hdel(_LEASE_OWNERS, celery_id)
+
+    # 값이 해당 task_id일 때만 연장됨 (다른 작업이 잡은 lease는 그대로)
+    return sum(refresh_analysis_lock(u, t) for u, t in owners)
+
+
+@celery_app.task
+def dispatch_pending():
+    # lease 만료 등으로 놓친 작업을 주기적으로 다시 디스패치
+    refresh_waiting_locks()
+    started = dispatch()
+    if started:
+        logger.info(f"[scheduler] {started}개 작업 디스패치")